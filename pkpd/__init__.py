@@ -0,0 +1,16 @@
+from .models import DrugModel, ModelException, models, registerModel, getModel
+from .schedule import DoseTimeline, Schedule, ScheduleItem, ScheduleException
+from .simulation import Constants, Compartments, SimulationData, SimulationStats, TaylorState, runTaylor, simulate
+from .batch import BatchSimulationData, simulateBatch
+from .linear import simulateLinear
+from .adaptive import simulateAdaptive
+from .storage import MemmapStorage, openSimulation, saveSimulation
+from .cache import SimulationCache
+from .checkpoint import CheckpointCache
+from .session import Session, extend, loadSession, startSession
+from .steadystate import SteadyState, periodicSteadyState
+from .optimize import OptimalDose, minimumDose, optimizeRegimen
+from .sweep import sweep
+from .reducers import QuantileDigest, RunningMoments
+from .population import PopulationBands, sampleParameters, simulatePopulation
+from .fitting import ParameterFit, fitParameters
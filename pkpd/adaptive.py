@@ -0,0 +1,151 @@
+import math
+
+import numpy as np
+
+from .simulation import Constants, SimulationData, scalpDHTReduction
+
+# Dormand-Prince 5(4) tableau, error weights and the coefficients of its
+# fourth-order continuous extension (as used by Hairer's DOPRI5).
+A = [
+    np.array([]),
+    np.array([1 / 5]),
+    np.array([3 / 40, 9 / 40]),
+    np.array([44 / 45, -56 / 15, 32 / 9]),
+    np.array([19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729]),
+    np.array([9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656]),
+]
+B = np.array([35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84])
+E = np.array([-71 / 57600, 0, 71 / 16695, -71 / 1920, 17253 / 339200, -22 / 525, 1 / 40])
+P = np.array([
+    [1, -8048581381 / 2820520608, 8663915743 / 2820520608, -12715105075 / 11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200 / 32700410799, -68118460800 / 10900136933, 87487479700 / 32700410799],
+    [0, -1754552775 / 470086768, 14199869525 / 1410260304, -10690763975 / 1880347072],
+    [0, 127303824393 / 49829197408, -318862633887 / 49829197408, 701980252875 / 199316789632],
+    [0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844],
+    [0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423],
+])
+
+def derivatives(y, const):
+    A_1, A_2, A_3, A_4, DHT, S5AR1, S5AR2 = y
+
+    dA_1 = -const.k_a * A_1
+    dA_2 = const.k_a * A_1 - (const.k_23 + const.k_20) * A_2 + const.k_32 * A_3
+    if const.saturableElimination:
+        dA_2 -= const.V_max * A_2 / (const.V_c * const.K_m + A_2)
+    dA_3 = const.k_23 * A_2 - const.k_32 * A_3
+    dA_4 = dA_2 / const.V_c
+    dDHT = const.k_out * const.DHT_ss * const.FAR_2 * S5AR2 + const.k_out * const.DHT_ss * (1 - const.FAR_2) * S5AR1 - const.k_out * DHT
+    dS5AR1 = np.zeros_like(S5AR1)
+    if const.srd5a1Inhibition:
+        dS5AR1 = const.k_1 - const.k_1 * S5AR1 - const.ko_1 * A_4 * S5AR1
+    dS5AR2 = const.k_2 - const.k_2 * S5AR2 - const.ko_2 * A_4 * S5AR2
+
+    return np.array([dA_1, dA_2, dA_3, dA_4, dDHT, dS5AR1, dS5AR2])
+
+# y may also be a (7 x N) array of N systems (for example virtual subjects
+# with per-subject parameters) that share one step size; a step is accepted
+# only if it is accurate enough for every column.
+# Complex states (complex-step sensitivities) are measured by magnitude.
+class AdaptiveIntegrator:
+    def __init__(self, const, rtol, atol, firstStep, maxStep):
+        self.const = const
+        self.rtol = rtol
+        self.atol = atol
+        self.h = firstStep
+        self.maxStep = maxStep
+        self.numSteps = 0
+        self.numRejected = 0
+        self.numEvaluations = 0
+
+    def rhs(self, y):
+        self.numEvaluations += 1
+        return derivatives(y, self.const)
+
+    # One accepted Dormand-Prince step from t, never stepping past tEnd.
+    # Returns the new time and state plus the stage derivatives for dense
+    # output; f is the derivative at (t, y) and is reused across steps (FSAL).
+    # The stages are stored flattened, one row per stage.
+    def step(self, t, y, f, tEnd):
+        K = np.empty((7, y.size), dtype=y.dtype)
+        K[0] = f.reshape(-1)
+        while True:
+            h = min(self.h, self.maxStep, tEnd - t)
+            for s in range(1, 6):
+                K[s] = self.rhs(y + h * (A[s] @ K[:s]).reshape(y.shape)).reshape(-1)
+            yNew = y + h * (B @ K[:6]).reshape(y.shape)
+            K[6] = self.rhs(yNew).reshape(-1)
+
+            scale = self.atol + np.maximum(np.abs(y), np.abs(yNew)) * self.rtol
+            error = float(np.sqrt(np.mean(np.abs(h * (E @ K).reshape(y.shape) / scale) ** 2, axis=0)).max())
+            if error <= 1:
+                factor = 10 if error == 0 else min(10, 0.9 * error ** -0.2)
+                # A step clipped at tEnd says nothing about the natural step
+                # size, so only grow h from unclipped steps.
+                if h == self.h or factor < 1:
+                    self.h = h * factor
+                self.numSteps += 1
+                return t + h, yNew, K, h
+            self.numRejected += 1
+            self.h = h * max(0.2, 0.9 * error ** -0.2)
+
+    # Dense output at an array of times inside the step that started at tOld.
+    def interpolate(self, tOld, y, K, h, times):
+        theta = (times - tOld) / h
+        powers = np.stack([theta, theta ** 2, theta ** 3, theta ** 4], axis=1)
+        return y + h * ((powers @ P.T) @ K).reshape((len(times),) + y.shape)
+
+# Integrates from state y at t = 0 through the whole schedule, passes the
+# states at sampleTimes to record(start, states) in consecutive runs and
+# returns the state at the end. Integration restarts at every dose, so the RK
+# stages never straddle the jump in A_1. The end of the run is a stop as well.
+def integrateSamples(integrator, y, schedule, sampleTimes, record):
+    totalSimTime = schedule.totalRunTime()
+    numSamples = len(sampleTimes)
+    timeline = schedule.timeline()
+    stops = list(zip(timeline.times, timeline.mg)) + [(totalSimTime, 0)]
+
+    t = 0
+    sample = 0
+    for stopTime, mg in stops:
+        f = integrator.rhs(y)
+        while t < stopTime:
+            tNew, yNew, K, h = integrator.step(t, y, f, stopTime)
+            end = np.searchsorted(sampleTimes, tNew - 1e-9)
+            if end > sample:
+                record(sample, integrator.interpolate(t, y, K, h, sampleTimes[sample:end]))
+                sample = end
+            t, y, f = tNew, yNew, K[6]
+        t = stopTime
+        y[0] += mg * 1000
+        while sample < numSamples and sampleTimes[sample] <= t + 1e-9:
+            record(sample, y[None])
+            sample += 1
+    return y
+
+def simulateAdaptive(resTime, schedule, model='dutasteride', rtol=1e-6, atol=1e-6, firstStep=0.01, maxStep=12, dtype=np.float64, storage=None):
+    const = Constants(firstStep, model)
+    integrator = AdaptiveIntegrator(const, rtol, atol, firstStep, maxStep)
+
+    totalSimTime = schedule.totalRunTime()
+    numSamples = int(math.ceil(totalSimTime / resTime - 1e-9))
+    sampleTimes = np.arange(numSamples) * resTime
+    data = SimulationData(const.model, numSamples, dtype, storage)
+    series = [data.series[name] for name in const.model.seriesNames()]
+
+    def record(start, states):
+        end = start + len(states)
+        series[0][start:end] = states[:, 3]
+        series[1][start:end] = 100 * (1 - states[:, 4] / const.DHT_ss)
+        if const.scalpDHT:
+            series[2][start:end] = 100 * (1 - scalpDHTReduction(states[:, 2]))
+
+    y = np.array([0, 0, 0, 0, const.DHT_ss, 1, 1], dtype=float)
+    integrateSamples(integrator, y, schedule, sampleTimes, record)
+
+    data.totalSimTime = totalSimTime
+    data.numSteps = integrator.numSteps
+    data.numEvaluations = integrator.numEvaluations
+    data.finish()
+
+    return data
@@ -0,0 +1,272 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+from .schedule import Schedule
+from .simulation import simulate
+
+# Benchmarks of the simulation core, written as JSON with the machine they
+# ran on so that runs before and after an engine change can be compared.
+#
+#   python -m pkpd.benchmark run -o before.json
+#   python -m pkpd.benchmark run -o after.json --only simulate
+#   python -m pkpd.benchmark compare before.json after.json --threshold 0.1
+#
+# Every benchmark reports metrics in seconds or bytes, where lower is better;
+# compare flags any that grew by more than the threshold and exits with 1.
+# Other metrics (rates, counts) are informational.
+
+class BenchmarkException(Exception):
+    pass
+
+benchmarks = {}
+
+def benchmark(name):
+    def register(function):
+        benchmarks[name] = function
+        return function
+    return register
+
+# Best and median wall time of repeat calls of function.
+def timeCalls(function, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return { 'seconds' : min(times), 'medianSeconds' : statistics.median(times), 'repeat' : repeat }
+
+shortSchedule = '[0.5, 1d] x 90d'
+# About 13k characters of alternating regimens.
+longSchedule = ', '.join(['[0.5, 1d] x 1w', '[1, 2d] x 2w', '[0.5, MWF] x 3w', '[2.5, 1w] x 1mo', '[0.5, 3d, 1, 2d] x 5w'] * 150)
+
+@benchmark('scheduleParseShort')
+def benchmarkParseShort(repeat):
+    result = timeCalls(lambda: [Schedule(shortSchedule) for i in range(1000)], repeat)
+    result['seconds'] /= 1000
+    result['medianSeconds'] /= 1000
+    return result
+
+@benchmark('scheduleParseLong')
+def benchmarkParseLong(repeat):
+    result = timeCalls(lambda: Schedule(longSchedule), repeat)
+    result['characters'] = len(longSchedule)
+    return result
+
+# doseAt queried at every 0.01 h step of four weeks of a weekday schedule, the
+# way the original per-step loop called it.
+@benchmark('scheduleDoseAt')
+def benchmarkDoseAt(repeat):
+    times = (np.arange(4 * 7 * 2400) * 0.01).tolist()
+    def run():
+        schedule = Schedule('[0.5, MWF] x 4w')
+        for t in times:
+            schedule.doseAt(t)
+    result = timeCalls(run, repeat)
+    result['calls'] = len(times)
+    result['callsPerSecond'] = len(times) / result['seconds']
+    return result
+
+# simulate at dt = 0.01 h, sampled the way the front end samples (with its
+# min and max reducers on runs coarser than a step). One untimed run first,
+# so loading or compiling the Numba loop is not timed.
+def simulateBenchmark(duration, repeat):
+    from .frontend import maxSamples
+
+    schedule = Schedule('[0.5, 1d] x ' + duration)
+    resTime = max(0.01, schedule.totalRunTime() / maxSamples)
+    reducers = ('min', 'max') if resTime > 0.01 else ()
+    simulate(0.01, resTime, schedule, reducers=reducers)
+    result = timeCalls(lambda: simulate(0.01, resTime, schedule, reducers=reducers), repeat)
+    result['steps'] = int(schedule.totalRunTime() / 0.01)
+    result['stepsPerSecond'] = result['steps'] / result['seconds']
+    return result
+
+@benchmark('simulate1w')
+def benchmarkSimulate1w(repeat):
+    return simulateBenchmark('1w', repeat)
+
+@benchmark('simulate1y')
+def benchmarkSimulate1y(repeat):
+    return simulateBenchmark('1y', repeat)
+
+@benchmark('simulate5y')
+def benchmarkSimulate5y(repeat):
+    return simulateBenchmark('5y', max(1, repeat // 2))
+
+# Size of the SimulationData of a one year run (resTime 0.01 h) and the peak
+# memory traced while it is simulated.
+@benchmark('simulationDataMemory')
+def benchmarkMemory(repeat):
+    schedule = Schedule('[0.5, 1d] x 1y')
+    tracemalloc.start()
+    try:
+        data = simulate(0.01, 0.01, schedule)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return { 'bytes' : int(sum(values.nbytes for values in data.series.values())), 'peakBytes' : int(peak), 'numSamples' : data.numSamples }
+
+# The xlim_changed callback of the plot window (resampling every line to the
+# window width) and the full canvas redraw, at random zoom windows over a
+# year long simulation, on the Agg backend.
+@benchmark('redrawLatency')
+def benchmarkRedraw(repeat):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from .frontend import maxSamples, plot
+
+    schedule = Schedule('[0.5, 1d] x 1y')
+    resTime = max(0.01, schedule.totalRunTime() / maxSamples)
+    data = simulate(0.01, resTime, schedule, reducers=('min', 'max'))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        plot(data)
+    fig = plt.gcf()
+    ax = fig.axes[0]
+    rng = np.random.default_rng(0)
+    windows = []
+    for i in range(max(20, 10 * repeat)):
+        x1, x2 = np.sort(rng.uniform(0, 365, 2))
+        windows.append((float(x1), float(x2) + 0.01))
+
+    callback = []
+    draw = []
+    for x1, x2 in windows:
+        start = time.perf_counter()
+        ax.set_xlim(x1, x2)
+        callback.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        fig.canvas.draw()
+        draw.append(time.perf_counter() - start)
+    plt.close(fig)
+    return {
+        'seconds' : statistics.median(callback),
+        'drawSeconds' : statistics.median(draw),
+        'redraws' : len(windows),
+    }
+
+def gitRevision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def machineMetadata():
+    try:
+        import numba
+        numbaVersion = numba.__version__
+    except ImportError:
+        numbaVersion = None
+    return {
+        'timestamp' : datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'hostname' : platform.node(),
+        'platform' : platform.platform(),
+        'machine' : platform.machine(),
+        'processor' : platform.processor(),
+        'cpuCount' : os.cpu_count(),
+        'python' : platform.python_version(),
+        'numpy' : np.__version__,
+        'numba' : numbaVersion,
+        'gitRevision' : gitRevision(),
+    }
+
+def runBenchmarks(names=None, repeat=5, log=None):
+    results = {}
+    for name, function in benchmarks.items():
+        if names and not any(pattern.lower() in name.lower() for pattern in names):
+            continue
+        if log is not None:
+            print(name + '...', end=' ', file=log, flush=True)
+        results[name] = function(repeat)
+        if log is not None:
+            print(', '.join(key + '=' + ('%.4g' % value) for key, value in results[name].items()), file=log, flush=True)
+    return { 'metadata' : machineMetadata(), 'benchmarks' : results }
+
+def lowerIsBetter(metric):
+    return metric.lower().endswith('seconds') or metric.lower().endswith('bytes')
+
+# Rows of (benchmark, metric, old, new, ratio, status) for every metric the
+# two runs share. status is 'regression' when new exceeds old by more than
+# threshold (a fraction), 'improvement' when it is that much lower and ''
+# otherwise.
+def compareResults(old, new, threshold=0.1):
+    rows = []
+    for name, oldMetrics in old['benchmarks'].items():
+        newMetrics = new['benchmarks'].get(name)
+        if newMetrics is None:
+            continue
+        for metric, oldValue in oldMetrics.items():
+            if not lowerIsBetter(metric) or metric not in newMetrics:
+                continue
+            newValue = newMetrics[metric]
+            ratio = newValue / oldValue if oldValue else float('inf') if newValue else 1.0
+            status = ''
+            if ratio > 1 + threshold:
+                status = 'regression'
+            elif ratio < 1 - threshold:
+                status = 'improvement'
+            rows.append((name, metric, oldValue, newValue, ratio, status))
+    return rows
+
+def loadResults(path):
+    try:
+        with open(path) as f:
+            results = json.load(f)
+    except ValueError:
+        raise BenchmarkException('Error: \'' + path + '\' is not a benchmark results file.')
+    if not isinstance(results, dict) or 'benchmarks' not in results:
+        raise BenchmarkException('Error: \'' + path + '\' is not a benchmark results file.')
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulation core and compare runs.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run the benchmarks and write the results as JSON')
+    run.add_argument('-o', '--output', required=True, help='results file (.json)')
+    run.add_argument('--repeat', type=int, default=5, help='timed repetitions per benchmark (the best is reported)')
+    run.add_argument('--only', nargs='*', help='run only benchmarks whose names contain one of these strings')
+    compare = commands.add_parser('compare', help='flag regressions between two results files')
+    compare.add_argument('baseline')
+    compare.add_argument('results')
+    compare.add_argument('--threshold', type=float, default=0.1, help='relative change that counts as a regression (default 0.1)')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'run':
+            results = runBenchmarks(args.only, max(1, args.repeat), sys.stderr)
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            return 0
+
+        old = loadResults(args.baseline)
+        new = loadResults(args.results)
+        for key in ('platform', 'processor', 'cpuCount', 'python', 'numba'):
+            if old.get('metadata', {}).get(key) != new.get('metadata', {}).get(key):
+                print('Warning: the runs differ in ' + key + ' (' + str(old.get('metadata', {}).get(key)) + ' vs ' + str(new.get('metadata', {}).get(key)) + ').')
+        rows = compareResults(old, new, args.threshold)
+        print('%-22s %-14s %12s %12s %8s' % ('benchmark', 'metric', 'baseline', 'results', 'ratio'))
+        for name, metric, oldValue, newValue, ratio, status in rows:
+            print('%-22s %-14s %12.4g %12.4g %8.3f %s' % (name, metric, oldValue, newValue, ratio, status.upper()))
+        regressions = [row for row in rows if row[5] == 'regression']
+        if regressions:
+            print(str(len(regressions)) + ' regression(s) beyond ' + ('%g%%' % (100 * args.threshold)) + '.')
+            return 1
+        return 0
+    except (BenchmarkException, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import collections
+import hashlib
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from .simulation import Constants, simulate
+from .storage import openSimulation, saveSimulation
+
+# Memoizes simulate. A result is keyed by the flattened regimen (see
+# DoseTimeline.canonicalKey), the Constants fingerprint, dt, resTime and the
+# remaining simulate arguments, so cosmetic variants of a schedule hit the
+# same entry. Results are kept in an LRU of at most maxEntries and
+# maxMemoryBytes of series in memory and, with a directory, on disk in the
+# MemmapStorage layout, evicting the least recently used entries once they
+# take more than maxBytes.
+#
+# Cached results are shared between callers, so their arrays are read-only.
+class SimulationCache:
+    def __init__(self, maxEntries=32, directory=None, maxBytes=2 ** 30, maxMemoryBytes=2 ** 28):
+        self.maxEntries = maxEntries
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxMemoryBytes = maxMemoryBytes
+        self.entries = collections.OrderedDict()
+        self.memoryBytes = 0
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, dt, resTime, schedule, model, method, dtype, reducers, options):
+        parts = [
+            schedule.timeline().canonicalKey(),
+            Constants(dt, model).fingerprint(),
+            repr((resTime, method, np.dtype(dtype).str, tuple(reducers), sorted(options.items()))),
+        ]
+        return hashlib.sha256('/'.join(parts).encode()).hexdigest()
+
+    def simulate(self, dt, resTime, schedule, model='dutasteride', method='taylor', dtype=np.float64, reducers=(), **options):
+        key = self.key(dt, resTime, schedule, model, method, dtype, reducers, options)
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+        data = self.load(key, model)
+        if data is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            data = simulate(dt, resTime, schedule, model, method, dtype, None, reducers, **options)
+            for values in data.series.values():
+                values.flags.writeable = False
+            self.store(key, data)
+
+        self.entries[key] = data
+        self.memoryBytes += self.size(data)
+        # The newest entry stays even if it alone is over maxMemoryBytes.
+        while len(self.entries) > 1 and (len(self.entries) > self.maxEntries or self.memoryBytes > self.maxMemoryBytes):
+            self.memoryBytes -= self.size(self.entries.popitem(last=False)[1])
+        return data
+
+    def size(self, data):
+        return sum(values.nbytes for values in data.series.values())
+
+    def clear(self):
+        self.entries.clear()
+        self.memoryBytes = 0
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    # Any entry that cannot be read back counts as a miss. The stored model
+    # name is not enough to rebuild a withParams or unregistered model, so
+    # the caller's model is used.
+    def load(self, key, model):
+        if self.directory is None or not os.path.isdir(self.path(key)):
+            return None
+        try:
+            data = openSimulation(self.path(key), model)
+        except Exception:
+            return None
+        # The modification time of an entry is its last use, for eviction.
+        os.utime(self.path(key))
+        return data
+
+    # Entries are written under a temporary name and renamed into place, so a
+    # concurrent reader never sees a partial entry.
+    def store(self, key, data):
+        if self.directory is None:
+            return
+        temporary = self.path('.tmp-' + uuid.uuid4().hex)
+        saveSimulation(data, temporary)
+        try:
+            os.replace(temporary, self.path(key))
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.tmp-') or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+            total += size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,93 @@
+import math
+
+import numpy as np
+
+from .simulation import Constants, SimulationData, TaylorState, runTaylor
+
+# First time at which two dose timelines differ, or infinity if they are the
+# same. A loop state taken at or before that time is valid for both.
+def divergenceTime(a, b):
+    n = min(len(a), len(b))
+    for j in range(n):
+        if a.times[j] != b.times[j] or a.mg[j] != b.mg[j]:
+            return min(a.times[j], b.times[j])
+    if len(a) > n:
+        return a.times[n]
+    if len(b) > n:
+        return b.times[n]
+    return math.inf
+
+# A finished fixed-step run kept for prefix sharing: its dose timeline, its
+# output and copies of its loop state (TaylorState) taken every few steps.
+class CheckpointedRun:
+    def __init__(self, group, timeline, data, checkpoints):
+        self.group = group
+        self.timeline = timeline
+        self.data = data
+        self.checkpoints = checkpoints
+
+# Fixed-step simulate that shares work between regimens with a common prefix,
+# e.g. '[0.5, 1d] x 6mo' followed by different tapers. Every run stores its
+# loop state every checkpointInterval hours; a later run with the same model
+# constants, resTime and dtype resumes from the latest checkpoint taken
+# before its doses diverge from a stored run, copies the output up to there
+# and only integrates the rest. Results are bit-identical to simulate. The
+# returned arrays are shared with the cache and therefore read-only.
+class CheckpointCache:
+    def __init__(self, checkpointInterval=24 * 7, maxRuns=16):
+        self.checkpointInterval = checkpointInterval
+        self.maxRuns = maxRuns
+        self.runs = []
+
+    def simulate(self, dt, resTime, schedule, model='dutasteride', dtype=np.float64, jit=True):
+        const = Constants(dt, model)
+        group = (const.fingerprint(), resTime, np.dtype(dtype).str)
+        timeline = schedule.timeline()
+        totalRunTime = schedule.totalRunTime()
+        numSteps = int(totalRunTime / dt)
+        data = SimulationData(const.model, int(numSteps * dt / resTime) + 2, dtype)
+        names = const.model.seriesNames()
+        series = [data.series[name] for name in names]
+
+        best = None
+        source = None
+        for run in self.runs:
+            if run.group != group:
+                continue
+            limit = divergenceTime(run.timeline, timeline)
+            for checkpoint in reversed(run.checkpoints):
+                if checkpoint.step <= numSteps and checkpoint.time <= limit:
+                    if best is None or checkpoint.step > best.step:
+                        best = checkpoint
+                        source = run
+                    break
+
+        if best is None:
+            state = TaylorState(const, resTime)
+            checkpoints = [state.copy()]
+        else:
+            state = best.copy()
+            for name, values in zip(names, series):
+                values[:state.sample] = source.data.series[name][:state.sample]
+            checkpoints = [checkpoint for checkpoint in source.checkpoints if checkpoint.step <= state.step]
+            self.runs.remove(source)
+            self.runs.append(source)
+        data.resumedFrom = state.step * dt
+
+        interval = max(1, int(round(self.checkpointInterval / dt)))
+        while state.step < numSteps:
+            stopStep = min(numSteps, (state.step // interval + 1) * interval)
+            runTaylor(const, state, timeline, stopStep, totalRunTime, resTime, series, None, jit)
+            if state.step < stopStep:
+                break
+            checkpoints.append(state.copy())
+
+        data.truncate(state.sample)
+        data.totalSimTime = totalRunTime
+        for values in data.series.values():
+            values.flags.writeable = False
+
+        self.runs.append(CheckpointedRun(group, timeline, data, checkpoints))
+        if len(self.runs) > self.maxRuns:
+            self.runs.pop(0)
+        return data
@@ -0,0 +1,173 @@
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .jobs import runSimulation, summarize
+from .models import ModelException, getModel
+from .schedule import ScheduleException
+
+# Non-interactive batch mode: reads one schedule per line (blank lines and
+# lines starting with '#' are skipped), simulates them in parallel and writes
+# either one row per regimen (summary) or one row per sample (samples) as
+# CSV, NPZ or Parquet (Parquet needs pyarrow).
+#
+#   python -m pkpd.cli schedules.txt -o results.csv
+#   cat schedules.txt | python -m pkpd.cli - -o samples.npz --rows samples
+
+class CLIException(Exception):
+    pass
+
+def readSchedules(source):
+    lines = [line.strip() for line in source]
+    return [line for line in lines if line and not line.startswith('#')]
+
+def positiveFloat(string):
+    try:
+        value = float(string)
+    except ValueError:
+        raise argparse.ArgumentTypeError('\'' + string + '\' is not a number')
+    if not value > 0:
+        raise argparse.ArgumentTypeError('must be positive, not ' + string)
+    return value
+
+# Runs in the worker processes. With summary set the worker reduces the
+# series to their summary, so only that is sent back. Any failure becomes
+# the error of the regimen instead of ending the batch.
+def simulateOne(job):
+    scheduleString, model, dt, resTime, method, summary = job
+    try:
+        result = runSimulation(scheduleString, model, dt, resTime, method)
+    except (ScheduleException, ModelException, ValueError) as e:
+        return None, str(e)
+    except Exception as e:
+        return None, 'Error: ' + type(e).__name__ + ': ' + str(e)
+    if summary:
+        result = { 'numSamples' : result['numSamples'], 'totalSimTime' : result['totalSimTime'], 'summary' : summarize(result) }
+    return result, None
+
+# Yields (index, schedule string, result, error) in input order while the
+# pool works ahead.
+def simulateAll(schedules, model, dt, resTime, method, workers, summary=False):
+    jobs = [(schedule, model, dt, resTime, method, summary) for schedule in schedules]
+    if workers == 1:
+        results = map(simulateOne, jobs)
+        for index, (result, error) in enumerate(results):
+            yield index, schedules[index], result, error
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunkSize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+        for index, (result, error) in enumerate(executor.map(simulateOne, jobs, chunksize=chunkSize)):
+            yield index, schedules[index], result, error
+
+# Output is written in blocks: dicts of column name to a NumPy array, all
+# of the same length. The summary is one block with a row per regimen.
+def summaryBlock(results, names):
+    table = { 'regimen' : [], 'schedule' : [], 'error' : [], 'numSamples' : [], 'totalSimTime' : [] }
+    for name in names:
+        for statistic in ('Final', 'Min', 'Max', 'Mean'):
+            table[name + statistic] = []
+    for index, schedule, result, error in results:
+        table['regimen'].append(index)
+        table['schedule'].append(schedule)
+        table['error'].append(error or '')
+        table['numSamples'].append(result['numSamples'] if result is not None else 0)
+        table['totalSimTime'].append(result['totalSimTime'] if result is not None else np.nan)
+        summary = result['summary'] if result is not None else {}
+        for name in names:
+            for statistic in ('final', 'min', 'max', 'mean'):
+                table[name + statistic.capitalize()].append(summary.get(name, {}).get(statistic, np.nan))
+    return { column : np.array(values, dtype=float if column == 'totalSimTime' else None) for column, values in table.items() }
+
+# One block per regimen, built from the result arrays without per-sample
+# Python objects.
+def sampleBlocks(results, names, resTime):
+    for index, schedule, result, error in results:
+        if error is not None:
+            print('Regimen ' + str(index) + ' (' + schedule + '): ' + error, file=sys.stderr)
+            continue
+        numSamples = result['numSamples']
+        block = { 'regimen' : np.full(numSamples, index), 'time' : np.arange(numSamples) * resTime }
+        for name in names:
+            block[name] = result['series'][name]
+        yield block
+
+def writeCSV(blocks, columns, output):
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for block in blocks:
+            writer.writerows(zip(*[block[column].tolist() for column in columns]))
+
+def writeNPZ(blocks, columns, output):
+    blocks = list(blocks)
+    if not blocks:
+        np.savez(output, **{ column : np.empty(0) for column in columns })
+        return
+    np.savez(output, **{ column : np.concatenate([block[column] for block in blocks]) for column in columns })
+
+# Every block becomes a row group, so only one block is in memory at a time.
+def writeParquet(blocks, columns, output):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise CLIException('Error: writing Parquet needs the pyarrow package.')
+    writer = None
+    try:
+        for block in blocks:
+            table = pyarrow.table({ column : block[column] for column in columns })
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(output, table.schema)
+            writer.write_table(table)
+        if writer is None:
+            pyarrow.parquet.write_table(pyarrow.table({ column : pyarrow.array([], pyarrow.float64()) for column in columns }), output)
+    finally:
+        if writer is not None:
+            writer.close()
+
+writers = { 'csv' : writeCSV, 'npz' : writeNPZ, 'parquet' : writeParquet }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate many dosing schedules without the plot window.')
+    parser.add_argument('input', help='file with one schedule per line, or - for stdin')
+    parser.add_argument('-o', '--output', required=True, help='output file (.csv, .npz or .parquet)')
+    parser.add_argument('--format', choices=sorted(writers), help='output format (default: from the output extension)')
+    parser.add_argument('--rows', choices=['summary', 'samples'], default='summary', help='one row per regimen or per sample')
+    parser.add_argument('--model', default='dutasteride')
+    parser.add_argument('--dt', type=positiveFloat, default=0.01)
+    parser.add_argument('--resTime', type=positiveFloat, default=1.0)
+    parser.add_argument('--method', default='taylor')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores, 1 runs in-process)')
+    args = parser.parse_args(argv)
+
+    try:
+        model = getModel(args.model)
+        outputFormat = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+        if outputFormat not in writers:
+            raise CLIException('Error: \'' + outputFormat + '\' is not a supported output format. Use csv, npz or parquet.')
+        if args.input == '-':
+            schedules = readSchedules(sys.stdin)
+        else:
+            with open(args.input) as f:
+                schedules = readSchedules(f)
+
+        names = model.seriesNames()
+        results = simulateAll(schedules, model.name, args.dt, args.resTime, args.method, args.workers, args.rows == 'summary')
+        if args.rows == 'summary':
+            columns = ['regimen', 'schedule', 'error', 'numSamples', 'totalSimTime'] + [name + statistic for name in names for statistic in ('Final', 'Min', 'Max', 'Mean')]
+            blocks = [summaryBlock(results, names)]
+        else:
+            columns = ['regimen', 'time'] + names
+            blocks = sampleBlocks(results, names, args.resTime)
+        writers[outputFormat](blocks, columns, args.output)
+    except (CLIException, ModelException, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
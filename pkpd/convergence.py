@@ -0,0 +1,110 @@
+import argparse
+import sys
+
+import numpy as np
+
+from .models import ModelException, getModel
+from .schedule import Schedule, ScheduleException
+from .simulation import simulate
+
+# Accuracy of the fixed-step integrator against dt for one regimen. The
+# regimen is simulated at successively halved dt and every run is compared
+# with a tight-tolerance adaptive reference on a common time grid: multiples
+# of the coarsest dt, which are steps of every run. Errors include the
+# dose timing of the fixed-step loop, which gives each dose on the first step
+# at or after its time.
+#
+# errors, rmsErrors and relativeErrors map every output series to one value
+# per dt: the largest absolute error, the root mean square error and the
+# largest absolute error over the peak of the reference series. orders holds
+# the observed order of convergence between each dt and the next smaller
+# one. recommendedDt is the largest dt at which, like at every smaller dt
+# tried, the relative error of every series is within tolerance, or None.
+class ConvergenceStudy:
+    def __init__(self, model, dts, tolerance, errors, rmsErrors, relativeErrors):
+        self.model = model
+        self.dts = dts
+        self.tolerance = tolerance
+        self.errors = errors
+        self.rmsErrors = rmsErrors
+        self.relativeErrors = relativeErrors
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.orders = { name : np.log2(values[:-1] / values[1:]) for name, values in errors.items() }
+        worst = np.max([values for values in relativeErrors.values()], axis=0)
+        self.recommendedDt = None
+        for dt, error in reversed(list(zip(dts, worst))):
+            if error > tolerance:
+                break
+            self.recommendedDt = float(dt)
+
+    def report(self):
+        names = list(self.errors)
+        lines = ['%-10s' % 'dt' + ''.join('%16s %6s' % (name, 'order') for name in names)]
+        for i, dt in enumerate(self.dts):
+            line = '%-10g' % dt
+            for name in names:
+                order = '%6.2f' % self.orders[name][i] if i < len(self.dts) - 1 else ''
+                line += '%16.3e %6s' % (self.relativeErrors[name][i], order)
+            lines.append(line)
+        if self.recommendedDt is None:
+            lines.append('No dt tried meets a relative error of %g.' % self.tolerance)
+        else:
+            lines.append('Largest dt with relative error within %g: %g h' % (self.tolerance, self.recommendedDt))
+        return '\n'.join(lines)
+
+# Runs the study for schedule at dt = coarsestDt, coarsestDt / 2, ... (levels
+# values). The default halves 0.64 h down to 0.005 h, passing through the
+# front end's 0.01 h. tolerance bounds the largest error of each series
+# relative to the peak of its reference; rtol and atol are the tolerances of
+# the adaptive reference.
+def convergenceStudy(schedule, model='dutasteride', tolerance=1e-3, coarsestDt=0.64, levels=8, rtol=1e-10, atol=1e-10):
+    model = getModel(model)
+    if coarsestDt <= 0 or levels < 1:
+        raise ModelException('Error: the convergence study needs a positive dt and at least one level.')
+    dts = coarsestDt / 2.0 ** np.arange(levels)
+    numSteps = int(schedule.totalRunTime() / dts[0])
+    if numSteps == 0:
+        raise ModelException('Error: the schedule is shorter than the coarsest dt.')
+
+    reference = simulate(coarsestDt, coarsestDt, schedule, model, method='adaptive', rtol=rtol, atol=atol)
+    names = model.seriesNames()
+    numGrid = min(numSteps, reference.numSamples)
+    errors = { name : np.empty(levels) for name in names }
+    rmsErrors = { name : np.empty(levels) for name in names }
+    relativeErrors = { name : np.empty(levels) for name in names }
+    for level, dt in enumerate(dts):
+        # One sample per step, so grid point j is sample j * 2 ** level.
+        data = simulate(dt, dt, schedule, model)
+        grid = np.arange(numGrid) * 2 ** level
+        grid = grid[grid < data.numSamples]
+        for name in names:
+            expected = reference.series[name][:len(grid)]
+            difference = data.series[name][grid] - expected
+            # dt past the stability limit blows up; that counts as an
+            # infinite error.
+            if not np.isfinite(difference).all():
+                errors[name][level] = rmsErrors[name][level] = relativeErrors[name][level] = np.inf
+                continue
+            errors[name][level] = np.abs(difference).max()
+            rmsErrors[name][level] = np.sqrt(np.mean(difference ** 2))
+            relativeErrors[name][level] = errors[name][level] / max(np.abs(expected).max(), np.finfo(float).tiny)
+    return ConvergenceStudy(model, dts, tolerance, errors, rmsErrors, relativeErrors)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find the largest fixed-step dt that meets an accuracy tolerance for a regimen.')
+    parser.add_argument('schedule', help='dosing schedule, e.g. "[0.5, 1d] x 90d"')
+    parser.add_argument('--model', default='dutasteride')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='largest error relative to the peak of each series (default 1e-3)')
+    parser.add_argument('--coarsestDt', type=float, default=0.64)
+    parser.add_argument('--levels', type=int, default=8)
+    args = parser.parse_args(argv)
+    try:
+        study = convergenceStudy(Schedule(args.schedule), args.model, args.tolerance, args.coarsestDt, args.levels)
+    except (ScheduleException, ModelException) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(study.report())
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import numpy as np
+
+from .adaptive import AdaptiveIntegrator, integrateSamples
+from .batch import BatchSystem, doseSteps, initialBatchState, predictNextBatchValues, stateNames
+from .models import ModelException, getModel
+from .simulation import Constants, scalpDHTReduction
+
+# Parameters fitted by default. Each is estimated on a log scale, so it stays
+# positive and its standard error reads as a coefficient of variation.
+defaultParameters = ('CL_l', 'V_c', 'V_max', 'K_m', 'ko_2')
+
+# Step of the complex-step derivative. The derivative has no cancellation
+# error, so the step can be far below the rounding error of the values.
+complexStep = 1e-20
+
+# Result of fitParameters. params maps every fitted parameter to its
+# estimate and standardErrors to the standard error of its log, model is the
+# model with the estimates filled in, and residuals holds the weighted
+# residuals of all observations at the estimate, series by series.
+class ParameterFit:
+    def __init__(self, model, params, standardErrors, cost, residuals, iterations, numSimulations, converged):
+        self.model = model
+        self.params = params
+        self.standardErrors = standardErrors
+        self.cost = cost
+        self.residuals = residuals
+        self.iterations = iterations
+        self.numSimulations = numSimulations
+        self.converged = converged
+
+# Observable quantities: the model's output series and the raw state
+# variables (e.g. 'DHT' in pg/mL). states holds one row per observation time
+# and one state variable per column, plus a trailing axis of systems.
+def observedQuantity(const, name, states):
+    names = const.model.seriesNames()
+    if name == names[0]:
+        return states[:, 3]
+    if name == names[1]:
+        return 100 * (1 - states[:, 4] / const.DHT_ss)
+    if const.scalpDHT and name == names[2]:
+        return 100 * (1 - scalpDHTReduction(states[:, 2]))
+    if name in stateNames:
+        return states[:, stateNames.index(name)]
+    raise ModelException('Error: \'' + str(name) + '\' is not an output series or state variable of model \'' + const.model.name + '\'.')
+
+# Fixed-step states of numColumns systems at the sorted times, with the same
+# dose placement and second-order steps as simulateBatch. A time between two
+# steps is interpolated linearly between the state after the dose at the
+# earlier step and the state that step leads to.
+def taylorStates(const, schedule, times, numColumns):
+    dt = const.dt
+    position = times / dt
+    lower = np.floor(position + 1e-9).astype(int)
+    fraction = np.maximum(position - lower, 0)[:, None, None]
+    needed = set(lower.tolist())
+
+    timeline = schedule.timeline()
+    doses = {}
+    for step, mg in zip(doseSteps(timeline.times, dt), timeline.mg):
+        doses[int(step)] = doses.get(int(step), 0) + mg * 1000
+
+    system = BatchSystem(const)
+    y = initialBatchState(const, numColumns).T.astype(system.M.dtype)
+    before = {}
+    after = {}
+    for i in range(int(lower.max()) + 1):
+        if i in doses:
+            y = y.copy()
+            y[0] += doses[i]
+        yNext = predictNextBatchValues(y, system, True)
+        if i in needed:
+            before[i] = y
+            after[i] = yNext
+        y = yNext
+    start = np.array([before[i] for i in lower.tolist()])
+    end = np.array([after[i] for i in lower.tolist()])
+    return start + fraction * (end - start)
+
+# States of numColumns systems at the sorted times from the dense output of
+# the Dormand-Prince integrator.
+def adaptiveStates(const, schedule, times, numColumns, rtol, atol, maxStep):
+    y = initialBatchState(const, numColumns).T.astype(complex)
+    states = np.empty((len(times),) + y.shape, dtype=complex)
+    def record(start, yStates):
+        states[start:start + len(yStates)] = yStates
+    integrator = AdaptiveIntegrator(const, rtol, atol, const.dt, maxStep)
+    integrateSamples(integrator, y, schedule, times, record)
+    return states
+
+# Fits parameters of model to one person's measurements under schedule by
+# weighted least squares, with Levenberg-Marquardt steps on the log of each
+# parameter.
+#
+# observations maps an output series or state variable (see
+# observedQuantity) to a pair of arrays (times in hours, measured values).
+# The times need not fall on resTime or dt samples; the fixed-step path
+# interpolates between steps and the adaptive path uses dense output. sigma
+# maps each name to its measurement standard deviation; by default a series
+# is scaled by the mean of its absolute values, so series in different units
+# weigh alike. initial overrides the starting values, which default to the
+# model's population values.
+#
+# The Jacobian comes from forward sensitivities of the integrator itself,
+# computed by complex-step differentiation: each parameter gets its own
+# column in one batched simulation, with an imaginary perturbation on that
+# parameter only. The real part of every column is the ordinary simulation
+# and the imaginary parts are the exact derivatives of the discrete scheme,
+# so an iteration costs one batched simulation instead of one per parameter
+# plus one.
+def fitParameters(schedule, observations, model='dutasteride', parameters=defaultParameters, sigma=None, initial=None, method='taylor', dt=0.01, rtol=1e-8, atol=1e-8, maxStep=12, tol=1e-10, maxIterations=100):
+    model = getModel(model)
+    parameters = list(parameters)
+    if not parameters:
+        raise ModelException('Error: no parameters to fit.')
+    for name in parameters:
+        if name not in model.params:
+            raise ModelException('Error: \'' + str(name) + '\' is not a parameter of model \'' + model.name + '\'.')
+    if method not in ('taylor', 'adaptive'):
+        raise ValueError('Unknown integration method \'' + str(method) + '\'.')
+
+    totalRunTime = schedule.totalRunTime()
+    series = []
+    for name, (times, values) in observations.items():
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if times.ndim != 1 or times.shape != values.shape or len(times) == 0:
+            raise ModelException('Error: observations of \'' + str(name) + '\' need equally long, non-empty arrays of times and values.')
+        if times.min() < 0 or times.max() > totalRunTime:
+            raise ModelException('Error: observations of \'' + str(name) + '\' lie outside the schedule, which runs for ' + str(totalRunTime) + ' hours.')
+        scale = (sigma or {}).get(name) or np.abs(values).mean() or 1
+        series.append((name, times, values, scale))
+    if not series:
+        raise ModelException('Error: no observations to fit.')
+    allTimes = np.unique(np.concatenate([times for name, times, values, scale in series]))
+    numParams = len(parameters)
+    numSimulations = 0
+
+    # Weighted residuals and their derivatives with respect to the log
+    # parameters, from one simulation of numParams columns.
+    def evaluate(logParams):
+        nonlocal numSimulations
+        numSimulations += 1
+        values = np.exp(logParams)
+        columns = {}
+        for k, name in enumerate(parameters):
+            columns[name] = np.full(numParams, values[k], dtype=complex)
+            columns[name][k] += 1j * complexStep * values[k]
+        const = Constants(dt, model.withParams(**columns))
+        if method == 'taylor':
+            states = taylorStates(const, schedule, allTimes, numParams)
+        else:
+            states = adaptiveStates(const, schedule, allTimes, numParams, rtol, atol, maxStep)
+
+        residuals = []
+        jacobians = []
+        for name, times, observed, scale in series:
+            predicted = observedQuantity(const, name, states[np.searchsorted(allTimes, times)])
+            residuals.append((predicted[:, 0].real - observed) / scale)
+            jacobians.append(predicted.imag / complexStep / scale)
+        return np.concatenate(residuals), np.vstack(jacobians)
+
+    logParams = np.log([float((initial or {}).get(name, model.params[name])) for name in parameters])
+    r, J = evaluate(logParams)
+    cost = 0.5 * r @ r
+    damping = 1e-3
+    iterations = 0
+    converged = False
+    while iterations < maxIterations and not converged:
+        iterations += 1
+        H = J.T @ J
+        g = J.T @ r
+        step = np.linalg.lstsq(H + damping * np.diag(np.diag(H)), -g, rcond=None)[0]
+        rTrial, JTrial = evaluate(logParams + step)
+        costTrial = 0.5 * rTrial @ rTrial
+        if costTrial < cost:
+            converged = cost - costTrial <= tol * cost or np.abs(step).max() <= tol
+            logParams = logParams + step
+            r, J, cost = rTrial, JTrial, costTrial
+            damping = max(damping / 3, 1e-12)
+        else:
+            # No step decreases the cost any more: a minimum to working
+            # precision.
+            damping *= 4
+            converged = damping > 1e12
+
+    H = J.T @ J
+    degreesOfFreedom = len(r) - numParams
+    variance = 2 * cost / degreesOfFreedom if degreesOfFreedom > 0 else np.nan
+    try:
+        standardErrors = np.sqrt(np.abs(np.diag(np.linalg.inv(H))) * variance)
+    except np.linalg.LinAlgError:
+        standardErrors = np.full(numParams, np.inf)
+    params = { name : float(value) for name, value in zip(parameters, np.exp(logParams)) }
+    return ParameterFit(model.withParams(**params), params, dict(zip(parameters, standardErrors.tolist())), float(cost), r, iterations, numSimulations, converged)
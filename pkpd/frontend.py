@@ -0,0 +1,182 @@
+
+import matplotlib.pyplot as plt
+import numpy as np
+from mplcursors import cursor
+from matplotlib.widgets import CheckButtons
+from matplotlib.ticker import MaxNLocator
+from matplotlib.transforms import Bbox
+import os
+
+from .cache import SimulationCache
+from .lod import MinMaxPyramid
+from .models import getModel
+from .schedule import Schedule, ScheduleException
+
+maxSamples = 200000
+
+# Re-entered schedules (including cosmetic variants) are plotted from here.
+cache = SimulationCache()
+
+def main(model='dutasteride'):
+    model = getModel(model)
+    os.system('mode con: cols=130 lines=30')
+
+    while True:
+        print('Enter a dosing schedule. Dosing schedule format examples:\n')
+        print('\t1)  [0.5, 1d] x 90d = 0.5 mg daily for 90 days.\n')
+        print('\t2)  [1, 2d] x 2mo = 1 mg every other day for 2 months.\n')
+        print('\t3)  [0.5, 3d, 1, 2d] x 16w = 0.5 mg, wait 3 days, 1 mg, wait 2 days, repeat for 16 weeks.\n')
+        print('\t4)  [2.5, 1w] x 0.5y, [0.5, 1d] x 0.5y = 2.5 mg per week for half a year, then 0.5 mg per day for half a year.\n')
+        print('\t5)  [0.5, MWF] x 45d = 0.5 mg on Monday Wednesday Friday for 45 days.\n')
+        print('\t6)  [1, SaSuTuTh] x 6mo = 1 mg on Saturday Sunday Tuesday Thursday for 6 months.\n')
+        print('\t7)  [0.5, 1d] x 1mo, [1, 1d] x 1mo, [1.5, 1d] x 1mo, [2, 1d] x 1mo = Increasing daily dose by 0.5 mg each month.\n')
+
+        print('Make sure to specify time units; default unit is days.\n')
+        print('Enter \'q\' to quit.\n')
+        inp = input('Your dosing schedule: ')
+        if ''.join(inp.lower().split()) == 'q':
+            break
+        schedule = None
+        try:
+            schedule = Schedule(inp)
+        except ScheduleException as se:
+            print()
+            print(se)
+            print()
+            input('Press enter to try again: ')
+            print()
+            continue
+
+        # Integrate at 0.01 h but keep at most maxSamples samples per series;
+        # short regimens still get every step.
+        resTime = max(0.01, schedule.totalRunTime() / maxSamples)
+        reducers = ('min', 'max') if resTime > 0.01 else ()
+        plot(cache.simulate(0.01, resTime, schedule, model, reducers=reducers))
+
+# Plot data for the days x1..x2 at numBins pixels: each pixel gets its min and
+# max as two consecutive points, so spikes narrower than a pixel still show.
+# The pixel just before the start of the data is pinned to 0, which draws the
+# rise from zero at day 0.
+def envelopeData(pyramids, simData, x1, x2, numBins):
+    samplesPerDay = 24 * simData.numSamples / simData.totalSimTime
+    edges = np.linspace(x1, x2, numBins + 1) * samplesPerDay
+    x = np.repeat(np.linspace(x1, x2, numBins), 2)
+    before = np.flatnonzero(edges[1:] <= 0)
+    ys = []
+    for pyramid in pyramids:
+        minimum, maximum = pyramid.envelope(edges)
+        if len(before):
+            minimum[before[-1]] = maximum[before[-1]] = 0
+        ys.append(np.column_stack([minimum, maximum]).ravel())
+    return x, ys
+
+def plot(simData):
+    model = simData.model
+
+    # Every line gets a min/max pyramid over its samples, built once here, so
+    # redrawing at any zoom level only slices the level that matches the pixel
+    # width. Bucket min/max series, when recorded, keep peaks between samples.
+    lineSeries = [model.drugSeries, 'ySerumDHTSup']
+    if model.scalpDHT:
+        lineSeries.append('yScalpDHTSup')
+    pyramids = [MinMaxPyramid(simData.series.get(name + 'Min', simData.series[name]), simData.series.get(name + 'Max', simData.series[name])) for name in lineSeries]
+
+    # The lines are resampled to the window width by on_xlims_change as soon
+    # as the x limits are set, so the initial plot only needs a coarse
+    # envelope for the y autoscaling.
+    x, ys = envelopeData(pyramids, simData, 0, simData.totalSimTime / 24, 2000)
+    ySerumDrug, ySerumDHTSup = ys[0], ys[1]
+
+    fig = plt.figure()
+    ax1 = fig.add_subplot()
+    fig.canvas.manager.set_window_title('Gisleskog et al. ' + model.drugName + ' Pharmacokinetics/Pharmacodynamics Modeling (Fuzzy\'s Implementation)')
+    ax2 = ax1.twinx()
+    ax3 = ax2.inset_axes([0.0, 0.9, 0.3, 0.1])
+    ax3.set_facecolor('white')
+
+    serumDrugLine, = ax1.plot(x, ySerumDrug, color=model.color, label='Serum ' + model.drugName + ' (ng/mL)')
+    serumDHTSupLine, = ax2.plot(x, ySerumDHTSup, color='green', label='Serum DHT Suppression (%)')
+    lines = [serumDrugLine, serumDHTSupLine]
+
+    if model.scalpDHT:
+        scalpDHTSupLine, = ax2.plot(x, ys[2], color='blue', label='Scalp DHT Suppression (%)')
+        lines.append(scalpDHTSupLine)
+
+        scalpDHTThresholdLine = ax2.plot(np.array([0, simData.totalSimTime / 24]), np.array([32, 32]), ':', color='blue', label='Minimum Scalp DHT Reduction (%)\nRequired for Efficacy ≥ Finasteride')
+
+    ax1.spines['right'].set_visible(False)
+    ax1.spines['left'].set_color(serumDrugLine.get_color())
+    ax1.tick_params(axis='y', colors=serumDrugLine.get_color())
+    ax1.set_xlabel('Time (days)')
+    ax1.set_ylabel(serumDrugLine.get_label())
+    ax1.tick_params(axis='y', colors=serumDrugLine.get_color())
+    ax1.yaxis.label.set_color(model.color)
+    ax1.grid(axis='x')
+
+    ax2.spines['left'].set_visible(False)
+    ax2.invert_yaxis()
+    ax2.yaxis.set_major_locator(MaxNLocator(nbins=10))
+    ax2.set_ylabel('DHT Suppression (%)')
+
+    linesDict = { line.get_label() : line for line in lines }
+    lineLabels = [line.get_label() for line in lines]
+    lineColors = [line.get_color() for line in lines]
+    check = CheckButtons(ax=ax3, labels=lineLabels, actives=[True] * len(lines), label_props={'color': lineColors}, frame_props={'edgecolor': lineColors}, check_props={'facecolor': lineColors})
+    for label in check.labels:
+        label.set_fontsize(12 / fig.dpi * 72)
+        label.set_fontname('DejaVu Sans')
+
+    def on_xlims_change(event):
+        bbox = ax1.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
+        width = bbox.width * fig.dpi
+
+        x1, x2 = tuple(map(float, event.get_xlim()))
+        res = int(width)
+        newX, ys = envelopeData(pyramids, simData, x1, x2, res)
+        for line, y in zip(lines, ys):
+            line.set_data(newX, y)
+
+        check.ax.set_position([0.0, 0.9, res * 0.01, 0.1])
+
+    ax1.callbacks.connect('xlim_changed', on_xlims_change)
+
+    def on_resize(event):
+        ax1.set_xlim(ax1.get_xlim())
+        widthi, heighti = fig.get_size_inches()
+        dpi = fig.get_dpi()
+        width, height = dpi * widthi, dpi * heighti
+        def locator(ax, _):
+            bbox = ax.get_position()
+            return Bbox.from_bounds(bbox.x0, bbox.y0 + bbox.height - 80 / height, 270 / width, 80 / height)
+        ax3.set_axes_locator(locator)
+
+    fig.canvas.mpl_connect('resize_event', on_resize)
+
+    ax1.set_xlim(ax1.get_xlim())
+    ax1.set_ylim(0, ax1.get_ylim()[1])
+    ax2.set_ylim(100, 0)
+
+    def onCheckClicked(label):
+        line = linesDict[label]
+        line.set_visible(not line.get_visible())
+        line.figure.canvas.draw_idle()
+
+    check.on_clicked(onCheckClicked)
+
+    def on_close(event):
+        ax1.clear()
+        ax2.clear()
+        ax3.clear()
+        fig.clear()
+        plt.close(fig)
+
+    fig.canvas.mpl_connect('close_event', on_close)
+
+    cur = cursor(hover=True)
+    @cur.connect("add")
+    def _(sel):
+        sel.annotation.get_bbox_patch().set(fc="white", alpha=1)
+        sel.annotation.arrow_patch.set(arrowstyle="simple", fc="white", alpha=1)
+
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,171 @@
+import numpy as np
+
+# Numba is optional. Without it compiledSimulate is None and simulate keeps
+# using the Python step loop.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# The fixed-step loop of runTaylor, including the dose cursor, the sample
+# clock and the body of predictNextCompartmentValues, as one function over
+# plain floats and arrays so that Numba can compile it. It performs the same
+# float operations in the same order as the Python path. The loop state is
+# read from and written back to state (A_1, A_2, A_3, A_4, DHT, S5AR1, S5AR2,
+# DHTp, scalpDHTp, time, sampleTime) and counters (step, sample, nextDose), and
+# the loop stops before step stopStep.
+#
+# With reducing set it also does the work of BucketReducer: row 3 * k + r of
+# reduced receives the bucket minimum (r = 0), maximum (1) and mean (2) of
+# output k, and bucket holds the open bucket (count, then the minimum,
+# maximum and total of each output).
+def simulateKernel(k_a, k_23, k_32, k_20, V_c, V_max, K_m, k_out, DHT_ss, FAR_2, k_1, ko_1, k_2, ko_2, saturable, srd5a1, scalpDHT, dt, dt2, resTime, stopStep, totalRunTime, doseTimes, doseMg, out0, out1, out2, state, counters, reducing, reduced, bucket):
+    A_1 = state[0]
+    A_2 = state[1]
+    A_3 = state[2]
+    A_4 = state[3]
+    DHT = state[4]
+    S5AR1 = state[5]
+    S5AR2 = state[6]
+    DHTp = state[7]
+    scalpDHTp = state[8]
+    time = state[9]
+    sampleTime = state[10]
+
+    k23k20 = k_23 + k_20
+    i = counters[0]
+    sample = counters[1]
+    nextDose = counters[2]
+    numDoses = len(doseTimes)
+    numOutputs = 3 if scalpDHT else 2
+    values = np.empty(3)
+    while i < stopStep:
+        while nextDose < numDoses and doseTimes[nextDose] <= time:
+            A_1 += doseMg[nextDose] * 1000
+            nextDose += 1
+        if time > totalRunTime:
+            break
+
+        while sampleTime >= resTime:
+            sampleTime -= resTime
+            if reducing and sample > 0:
+                # An empty bucket falls back to the point sample values.
+                if bucket[0] == 0:
+                    values[0] = out0[sample - 1]
+                    values[1] = out1[sample - 1]
+                    values[2] = out2[sample - 1]
+                    for k in range(numOutputs):
+                        bucket[1 + k] = values[k]
+                        bucket[4 + k] = values[k]
+                        bucket[7 + k] = values[k]
+                    bucket[0] = 1
+                for k in range(numOutputs):
+                    reduced[3 * k, sample - 1] = bucket[1 + k]
+                    reduced[3 * k + 1, sample - 1] = bucket[4 + k]
+                    reduced[3 * k + 2, sample - 1] = bucket[7 + k] / bucket[0]
+                bucket[0] = 0
+            out0[sample] = A_4
+            out1[sample] = DHTp
+            if scalpDHT:
+                out2[sample] = scalpDHTp
+            sample += 1
+        if reducing:
+            values[0] = A_4
+            values[1] = DHTp
+            values[2] = scalpDHTp
+            if bucket[0] == 0:
+                for k in range(numOutputs):
+                    bucket[1 + k] = values[k]
+                    bucket[4 + k] = values[k]
+                    bucket[7 + k] = values[k]
+            else:
+                for k in range(numOutputs):
+                    value = values[k]
+                    if value < bucket[1 + k]:
+                        bucket[1 + k] = value
+                    elif value > bucket[4 + k]:
+                        bucket[4 + k] = value
+                    bucket[7 + k] += value
+            bucket[0] += 1
+
+        N = 1
+        h = dt
+        h2 = dt2
+        dS5AR2 = k_2 - k_2 * S5AR2 - ko_2 * A_4 * S5AR2
+        stable = abs(dS5AR2) < S5AR2 * 100
+        if srd5a1:
+            dS5AR1 = k_1 - k_1 * S5AR1 - ko_1 * A_4 * S5AR1
+            stable = stable and abs(dS5AR1) < S5AR1 * 100
+        if not stable:
+            N = 10
+            h /= N
+            h2 /= N * N
+
+        dS5AR1 = 0.0
+        d2S5AR1 = 0.0
+        for j in range(N):
+            dA_1 = -k_a * A_1
+            dA_2 = k_a * A_1 - k23k20 * A_2 + k_32 * A_3
+            vckma2 = 1.0
+            if saturable:
+                vckma2 = V_c * K_m + A_2
+                dA_2 -= V_max * A_2 / vckma2
+            dA_3 = k_23 * A_2 - k_32 * A_3
+            dA_4 = dA_2 / V_c
+            dDHT = k_out * DHT_ss * FAR_2 * S5AR2 + k_out * DHT_ss * (1 - FAR_2) * S5AR1 - k_out * DHT
+            if srd5a1:
+                dS5AR1 = k_1 - k_1 * S5AR1 - ko_1 * A_4 * S5AR1
+            dS5AR2 = k_2 - k_2 * S5AR2 - ko_2 * A_4 * S5AR2
+
+            d2A_1 = -k_a * dA_1
+            d2A_2 = k_a * dA_1 - k23k20 * dA_2 + k_32 * dA_3
+            if saturable:
+                d2A_2 -= V_max * (vckma2 * dA_2 - A_2 * dA_2) / (vckma2 ** 2)
+            d2A_3 = k_23 * dA_2 - k_32 * dA_3
+            d2A_4 = d2A_2 / V_c
+            d2DHT = k_out * DHT_ss * FAR_2 * dS5AR2 + k_out * DHT_ss * (1 - FAR_2) * dS5AR1 - k_out * dDHT
+            if srd5a1:
+                d2S5AR1 = -k_1 * dS5AR1 - ko_1 * (A_4 * dS5AR1 + dA_4 * S5AR1)
+            d2S5AR2 = -k_2 * dS5AR2 - ko_2 * (A_4 * dS5AR2 + dA_4 * S5AR2)
+
+            A_1 += dA_1 * h
+            A_2 += dA_2 * h
+            A_3 += dA_3 * h
+            A_4 += dA_4 * h
+            DHT += dDHT * h
+            S5AR1 += dS5AR1 * h
+            S5AR2 += dS5AR2 * h
+
+            A_1 += d2A_1 * h2
+            A_2 += d2A_2 * h2
+            A_3 += d2A_3 * h2
+            A_4 += d2A_4 * h2
+            DHT += d2DHT * h2
+            S5AR1 += d2S5AR1 * h2
+            S5AR2 += d2S5AR2 * h2
+
+        DHTp = 100 * (1 - DHT / DHT_ss)
+        if scalpDHT:
+            c = A_3
+            scalpDHTp = 100 * (1 - (0.358 * (1 - c / (68.235 + c)) + 0.642 * (1 - c / (27614.478 + c))))
+
+        time += dt
+        sampleTime += dt
+        i += 1
+
+    state[0] = A_1
+    state[1] = A_2
+    state[2] = A_3
+    state[3] = A_4
+    state[4] = DHT
+    state[5] = S5AR1
+    state[6] = S5AR2
+    state[7] = DHTp
+    state[8] = scalpDHTp
+    state[9] = time
+    state[10] = sampleTime
+    counters[0] = i
+    counters[1] = sample
+    counters[2] = nextDose
+
+compiledSimulate = njit(cache=True)(simulateKernel) if njit is not None else None
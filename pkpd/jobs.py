@@ -0,0 +1,26 @@
+import numpy as np
+
+from .schedule import Schedule
+from .simulation import simulate
+
+# Simulation jobs run in the worker processes of the HTTP service and the
+# batch command line. Jobs take the schedule as a string and the model by
+# name, so they pickle cheaply, and return plain arrays.
+
+def runSimulation(scheduleString, model, dt, resTime, method):
+    data = simulate(dt, resTime, Schedule(scheduleString), model, method)
+    series = { name : np.asarray(values) for name, values in data.series.items() }
+    return { 'series' : series, 'numSamples' : data.numSamples, 'totalSimTime' : data.totalSimTime }
+
+def summarize(result):
+    summary = {}
+    for name, values in result['series'].items():
+        if len(values) == 0:
+            continue
+        summary[name] = {
+            'final' : float(values[-1]),
+            'min' : float(values.min()),
+            'max' : float(values.max()),
+            'mean' : float(values.mean()),
+        }
+    return summary
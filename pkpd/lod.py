@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+
+# Reduces consecutive blocks of factor samples with a ufunc (np.minimum or
+# np.maximum). Works in chunks so memory-mapped series are streamed rather
+# than read whole.
+def blockReduce(values, factor, ufunc, chunk=2 ** 20):
+    out = np.empty(int(math.ceil(len(values) / factor)), dtype=values.dtype)
+    span = chunk * factor
+    for start in range(0, len(values), span):
+        part = np.asarray(values[start:start + span])
+        out[start // factor:start // factor + int(math.ceil(len(part) / factor))] = ufunc.reduceat(part, np.arange(0, len(part), factor))
+    return out
+
+# Level-of-detail pyramid of a sample series for plotting. Level k holds the
+# min and max of each block of factor ** k samples, so the envelope of any
+# range at any pixel width is read from a level with about one block per
+# pixel instead of scanning the samples. Level 0 is the series itself (or its
+# per-bucket min/max series when the simulation recorded them).
+class MinMaxPyramid:
+    def __init__(self, minimum, maximum=None, factor=4):
+        if maximum is None:
+            maximum = minimum
+        self.factor = factor
+        self.numSamples = len(minimum)
+        self.levels = [(minimum, maximum)]
+        while len(self.levels[-1][0]) > 1:
+            lo, hi = self.levels[-1]
+            self.levels.append((blockReduce(lo, factor, np.minimum), blockReduce(hi, factor, np.maximum)))
+
+    # Min and max per bin for bin edges given in (fractional) sample indices.
+    # Bins narrower than a sample pick the sample they start in; bins outside
+    # the series are NaN.
+    def envelope(self, edges):
+        edges = np.asarray(edges, dtype=float)
+        numBins = len(edges) - 1
+        minimum = np.full(numBins, np.nan)
+        maximum = np.full(numBins, np.nan)
+        if self.numSamples == 0 or numBins <= 0:
+            return minimum, maximum
+
+        samplesPerBin = (edges[-1] - edges[0]) / numBins
+        level = 0
+        while level + 1 < len(self.levels) and self.factor ** (level + 1) <= samplesPerBin:
+            level += 1
+        lo, hi = self.levels[level]
+        block = self.factor ** level
+
+        index = np.clip(np.floor(edges / block), 0, len(lo)).astype(int)
+        valid = (edges[1:] > 0) & (index[:-1] < len(lo))
+        starts = index[:-1][valid]
+        if len(starts) == 0:
+            return minimum, maximum
+        # reduceat covers the blocks from each start up to the next one, and
+        # the last bin up to the end of the slice it is given. A bin that ends
+        # inside a block also needs that block, which the next bin starts at.
+        stop = min(len(lo), max(index[-1], starts[-1] + 1))
+        last = np.clip(np.ceil(edges[1:] / block).astype(int) - 1, index[:-1], len(lo) - 1)[valid]
+        minimum[valid] = np.minimum(np.minimum.reduceat(np.asarray(lo[starts[0]:stop]), starts - starts[0]), lo[last])
+        maximum[valid] = np.maximum(np.maximum.reduceat(np.asarray(hi[starts[0]:stop]), starts - starts[0]), hi[last])
+        return minimum, maximum
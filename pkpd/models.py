@@ -0,0 +1,90 @@
+class ModelException(Exception):
+    pass
+
+class DrugModel:
+    def __init__(self, name, drugName, drugSeries, color, params, saturableElimination=False, srd5a1Inhibition=False, scalpDHT=False):
+        self.name = name
+        self.drugName = drugName
+        self.drugSeries = drugSeries
+        self.color = color
+        self.params = dict(params)
+
+        # Which terms of the Gisleskog system are active for this drug. Inactive
+        # terms are skipped by the integrator rather than evaluated as zero.
+        self.saturableElimination = saturableElimination
+        self.srd5a1Inhibition = srd5a1Inhibition
+        self.scalpDHT = scalpDHT
+
+    def seriesNames(self):
+        names = [self.drugSeries, 'ySerumDHTSup']
+        if self.scalpDHT:
+            names.append('yScalpDHTSup')
+        return names
+
+    def withParams(self, **params):
+        newParams = dict(self.params)
+        newParams.update(params)
+        return DrugModel(self.name, self.drugName, self.drugSeries, self.color, newParams, self.saturableElimination, self.srd5a1Inhibition, self.scalpDHT)
+
+models = {}
+
+def registerModel(model):
+    models[model.name] = model
+    return model
+
+def getModel(model):
+    if isinstance(model, DrugModel):
+        return model
+    if model not in models:
+        raise ModelException('Error: \'' + str(model) + '\' is not a registered drug model. Available models: ' + ', '.join(models) + '.')
+    return models[model]
+
+registerModel(DrugModel('dutasteride', 'Dutasteride', 'ySerumDut', 'red', {
+    'Q': 33.5,
+    'V_p': 338,
+    'CL_l': 0.583,
+    'V_c': 173,
+    'k_a': 2.41,
+    'V_max': 5.91,
+    'K_m': 0.957,
+    'V_ss': 511,
+    'DHT_ss': 488,
+    'k_out': 0.393,
+    'FAR_2': 0.827,
+    'k_1': 0.0153,
+    'k_2': 0.00871,
+    'ko_1': 0.000594,
+    'ko_2': 0.0357,
+}, saturableElimination=True, srd5a1Inhibition=True, scalpDHT=True))
+
+registerModel(DrugModel('finasteride_original', 'Finasteride', 'ySerumFin', 'purple', {
+    'Q': 3.2,
+    'V_p': 37,
+    'CL_l': 23,
+    'V_c': 97,
+    'k_a': 3.2,
+    'V_ss': 134,
+    'DHT_ss': 488,
+    'k_out': 0.393,
+    'FAR_2': 0.827,
+    'k_1': 0.0153,
+    'k_2': 0.00871,
+    'ko_2': 0.0108,
+}))
+
+# Same as finasteride_original, but with linear clearance reduced by a factor of
+# 1.5, a smaller SRD5A2 share of DHT production and stronger SRD5A2 inhibition.
+registerModel(DrugModel('finasteride_tweaked', 'Finasteride', 'ySerumFin', 'purple', {
+    'Q': 3.2,
+    'V_p': 37,
+    'CL_l': 23 / 1.5,
+    'V_c': 97,
+    'k_a': 3.2,
+    'V_ss': 134,
+    'DHT_ss': 488,
+    'k_out': 0.393,
+    'FAR_2': 0.75,
+    'k_1': 0.0153,
+    'k_2': 0.00871,
+    'ko_2': 0.04,
+}))
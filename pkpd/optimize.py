@@ -0,0 +1,145 @@
+import math
+
+import numpy as np
+
+from .adaptive import AdaptiveIntegrator, integrateSamples
+from .batch import initialBatchState
+from .models import ModelException, getModel
+from .schedule import Schedule
+from .simulation import Constants, scalpDHTReduction
+from .steadystate import SteadyState
+
+# Result of minimumDose: the smallest dose (mg) per interval (hours) whose
+# steady-state trough of series reaches target, its steady state and the
+# number of Newton iterations it took.
+class OptimalDose:
+    def __init__(self, dose, interval, series, target, steadyState, iterations):
+        self.dose = dose
+        self.interval = interval
+        self.series = series
+        self.target = target
+        self.steadyState = steadyState
+        self.iterations = iterations
+        self.trough = steadyState.trough[series]
+        self.weeklyDose = dose * 24 * 7 / interval
+
+    def schedule(self):
+        return '[%g, %gh]' % (self.dose, self.interval)
+
+# series defaults to scalp DHT suppression where the model has it and serum
+# DHT suppression otherwise.
+def suppressionSeries(model, series):
+    names = model.seriesNames()
+    if series is None:
+        return names[2] if model.scalpDHT else names[1]
+    if series not in names[1:]:
+        raise ModelException('Error: \'' + str(series) + '\' is not a DHT suppression series of model \'' + model.name + '\'.')
+    return series
+
+# Output series of sampled states, one row per sample and one column per
+# system.
+def suppression(const, states, series):
+    if series == const.model.seriesNames()[1]:
+        return 100 * (1 - states[:, 4] / const.DHT_ss)
+    return 100 * (1 - scalpDHTReduction(states[:, 2]))
+
+# Smallest dose given every interval hours whose steady-state trough of a
+# DHT suppression series is target percent, e.g. scalp DHT suppressed by at
+# least 32%.
+#
+# Rather than bracketing the dose with one steady-state solve per trial, the
+# dose is solved together with the periodic steady state: Newton iteration on
+# the free states and the log of the dose, for F(y, dose) = y and
+# trough(y, dose) = target, with a finite-difference Jacobian. The dose is
+# given at the start of the period, so it is just part of the initial state
+# of each column and the base and every perturbed system are integrated
+# through one period together with the adaptive integrator. This converges
+# in a handful of periods from a drug-free start.
+def minimumDose(interval, target=32, series=None, model='dutasteride', firstDose=0.5, maxDose=1e3, tol=1e-8, maxIterations=50, samplesPerPeriod=500, rtol=1e-6, atol=1e-6):
+    model = getModel(model)
+    series = suppressionSeries(model, series)
+    if interval <= 0:
+        raise ModelException('Error: the dosing interval must be positive.')
+
+    dt = interval / samplesPerPeriod
+    const = Constants(dt, model)
+    schedule = Schedule('[0, %rh]' % interval)
+    sampleTimes = np.arange(samplesPerPeriod) * dt
+
+    # Integrates one period from every column of y, the dose already added.
+    # Returns the end states and the trough of series of every column.
+    def propagate(y):
+        states = np.empty((samplesPerPeriod,) + y.shape)
+        def record(start, yStates):
+            states[start:start + len(yStates)] = yStates
+        integrator = AdaptiveIntegrator(const, rtol, atol, dt, interval)
+        end = integrateSamples(integrator, y.copy(), schedule, sampleTimes, record)
+        return end, suppression(const, states, series).min(axis=0), states
+
+    # As in periodicSteadyState, A_4 follows from A_2 and S5AR1 stays at 1
+    # without SRD5A1 inhibition.
+    free = [0, 1, 2, 4, 5, 6] if const.srd5a1Inhibition else [0, 1, 2, 4, 6]
+    y = initialBatchState(const, 1)[0]
+    logDose = math.log(firstDose)
+    n = len(free)
+    iterations = 0
+    converged = False
+    while iterations < maxIterations and not converged:
+        iterations += 1
+        z = np.append(y[free], logDose)
+        steps = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(z), 1)
+        columns = np.repeat(y[:, None], n + 2, axis=1)
+        columns[free, np.arange(1, n + 1)] += steps[:n]
+        columns[3] = columns[1] / const.V_c
+        doses = np.full(n + 2, logDose)
+        doses[n + 1] += steps[n]
+        columns[0] += np.exp(doses) * 1000
+        end, trough, states = propagate(columns)
+
+        residual = np.append(end[free, 0] - y[free], trough[0] - target)
+        converged = np.all(np.abs(residual[:n]) <= tol * (1 + np.abs(y[free]))) and abs(residual[n]) <= tol * (1 + abs(target))
+        values = np.vstack([end[free], trough])
+        J = (values[:, 1:] - values[:, :1]) / steps
+        J[:n, :n] -= np.eye(n)
+        delta = np.linalg.solve(J, -residual)
+        # Limit the dose to a factor of 4 per iteration while far from the
+        # solution.
+        delta[n] = min(max(delta[n], -math.log(4)), math.log(4))
+        if not converged:
+            y[free] += delta[:n]
+            y[:3] = np.maximum(y[:3], 0)
+            y[3] = y[1] / const.V_c
+            logDose += delta[n]
+        if logDose > math.log(maxDose):
+            raise ModelException('Error: a trough of ' + str(target) + '% ' + series + ' is not reachable with doses up to ' + str(maxDose) + ' mg every ' + str(interval) + ' hours.')
+
+    if not converged:
+        raise ModelException('Error: the minimum dose did not converge in ' + str(maxIterations) + ' iterations.')
+
+    # The base column of the converged iteration is the steady state.
+    names = model.seriesNames()
+    base = states[:, :, 0]
+    steadySeries = { names[0] : base[:, 3], names[1] : suppression(const, base, names[1]) }
+    if const.scalpDHT:
+        steadySeries[names[2]] = suppression(const, base, names[2])
+    dose = math.exp(logDose)
+    return OptimalDose(dose, interval, series, target, SteadyState(model, interval, y, steadySeries, iterations), iterations)
+
+# Cheapest of the candidate dosing intervals (hours) by total mg per week.
+# Returns the OptimalDose of every interval, cheapest first; intervals where
+# the target is out of reach are left out.
+def optimizeRegimen(target=32, series=None, model='dutasteride', intervals=(24, 48, 72, 24 * 7), **options):
+    model = getModel(model)
+    series = suppressionSeries(model, series)
+    results = []
+    for interval in intervals:
+        if interval <= 0:
+            raise ModelException('Error: the dosing interval must be positive.')
+        try:
+            results.append(minimumDose(interval, target, series, model, **options))
+        except ModelException:
+            pass
+    if not results:
+        raise ModelException('Error: a trough of ' + str(target) + '% is not reachable with any of the dosing intervals.')
+    results.sort(key=lambda result: result.weeklyDose)
+    return results
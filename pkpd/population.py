@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+
+from .adaptive import AdaptiveIntegrator, integrateSamples
+from .models import getModel
+from .reducers import QuantileDigest, RunningMoments
+from .simulation import Constants, scalpDHTReduction
+
+# Default between-subject variability: the standard deviation of the
+# log-normal random effect on each parameter (about a 30% CV). These are not
+# fitted values; pass variability with study estimates when they are known.
+defaultVariability = {
+    'CL_l': 0.3,
+    'V_c': 0.3,
+    'V_max': 0.3,
+    'K_m': 0.3,
+    'k_out': 0.3,
+    'ko_1': 0.3,
+    'ko_2': 0.3,
+}
+
+# Draws numSubjects parameter sets as value * exp(eta) with eta ~ N(0, omega^2)
+# per parameter. Parameters the model does not have are skipped.
+def sampleParameters(model, numSubjects, variability=None, seed=None):
+    model = getModel(model)
+    if variability is None:
+        variability = defaultVariability
+    rng = np.random.default_rng(seed)
+    params = {}
+    for name, omega in variability.items():
+        if name in model.params:
+            params[name] = model.params[name] * np.exp(omega * rng.standard_normal(numSubjects))
+    return params
+
+# Percentile bands of a simulated population. bands maps each output series
+# to a (len(percentiles) x numSamples) array and mean and std to arrays of
+# numSamples; times are in hours.
+class PopulationBands:
+    def __init__(self, model, percentiles, times, params):
+        self.model = model
+        self.percentiles = tuple(percentiles)
+        self.times = times
+        self.params = params
+        self.numSubjects = len(next(iter(params.values()))) if params else 0
+        self.bands = {}
+        self.mean = {}
+        self.std = {}
+        self.totalSimTime = 0
+
+    def band(self, name, percentile):
+        return self.bands[name][self.percentiles.index(percentile)]
+
+# Simulates numSubjects virtual subjects with log-normal variability on their
+# parameters. Subjects are integrated chunkSize at a time as one (7 x chunk)
+# state array by the adaptive integrator, with a step size shared across the
+# chunk. Every chunk's samples are streamed into a quantile digest and running
+# moments per sample (see pkpd.reducers), so memory does not grow with the
+# number of subjects. The default tolerances are looser than
+# simulateAdaptive's; the resulting error is far below the spread between
+# subjects.
+#
+# Run time grows with the number of subjects times the number of steps. For
+# daily dosing sampled hourly, 1000 subjects over 90 days take a few seconds;
+# 10,000 subjects take about 20 s over 90 days and about 2 minutes over a
+# year, most of it in the integrator.
+def simulatePopulation(resTime, schedule, model='dutasteride', numSubjects=1000, variability=None, percentiles=(5, 50, 95), seed=None, rtol=1e-4, atol=1e-4, firstStep=0.01, maxStep=12, chunkSize=2000, compression=100, blockSamples=64):
+    model = getModel(model)
+    params = sampleParameters(model, numSubjects, variability, seed)
+
+    totalSimTime = schedule.totalRunTime()
+    numSamples = int(math.ceil(totalSimTime / resTime - 1e-9))
+    sampleTimes = np.arange(numSamples) * resTime
+    result = PopulationBands(model, percentiles, sampleTimes, params)
+    names = model.seriesNames()
+    digests = [QuantileDigest(numSamples, compression) for name in names]
+    moments = [RunningMoments(numSamples) for name in names]
+    result.numSteps = 0
+
+    for first in range(0, numSubjects, chunkSize):
+        chunk = slice(first, min(numSubjects, first + chunkSize))
+        const = Constants(firstStep, model.withParams(**{ name : values[chunk] for name, values in params.items() }))
+        integrator = AdaptiveIntegrator(const, rtol, atol, firstStep, maxStep)
+
+        # The integrator records a few samples per step; they are collected
+        # and passed to the reducers blockSamples samples at a time.
+        pending = []
+        def flush():
+            start = pending[0][0]
+            states = np.concatenate([states for first, states in pending])
+            pending.clear()
+            outputs = [states[:, 3], 100 * (1 - states[:, 4] / const.DHT_ss)]
+            if const.scalpDHT:
+                outputs.append(100 * (1 - scalpDHTReduction(states[:, 2])))
+            for digest, moment, values in zip(digests, moments, outputs):
+                digest.update(start, values)
+                moment.update(start, values)
+
+        def record(start, states):
+            pending.append((start, states))
+            if start + len(states) - pending[0][0] >= blockSamples:
+                flush()
+
+        y = np.zeros((7, chunk.stop - chunk.start))
+        y[4] = const.DHT_ss
+        y[5] = 1
+        y[6] = 1
+        integrateSamples(integrator, y, schedule, sampleTimes, record)
+        if pending:
+            flush()
+        result.numSteps += integrator.numSteps
+
+    for name, digest, moment in zip(names, digests, moments):
+        result.bands[name] = digest.percentiles(percentiles)
+        result.mean[name] = moment.mean
+        result.std[name] = moment.std()
+    result.totalSimTime = totalSimTime
+    return result
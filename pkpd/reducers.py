@@ -0,0 +1,94 @@
+import math
+
+import numpy as np
+
+# Streaming statistics over many trajectories sampled on a common time grid.
+# Each reducer keeps a fixed amount of state per time bucket and consumes
+# chunks of trajectories as they are produced: update(start, values) takes a
+# (buckets x trajectories) array for the buckets start, start + 1, ... so that
+# memory depends only on the number of buckets, not on how many trajectories
+# have been seen.
+
+# Count, mean and variance per bucket, merged chunk by chunk with Chan et
+# al.'s parallel update.
+class RunningMoments:
+    def __init__(self, numBuckets):
+        self.count = np.zeros(numBuckets)
+        self.mean = np.zeros(numBuckets)
+        self.M2 = np.zeros(numBuckets)
+
+    def update(self, start, values):
+        values = np.asarray(values, dtype=float)
+        end = start + len(values)
+        n = values.shape[1]
+        if n == 0:
+            return
+        chunkMean = values.mean(axis=1)
+        chunkM2 = ((values - chunkMean[:, None]) ** 2).sum(axis=1)
+
+        count = self.count[start:end]
+        total = count + n
+        delta = chunkMean - self.mean[start:end]
+        self.mean[start:end] += delta * n / total
+        self.M2[start:end] += chunkM2 + delta * delta * count * n / total
+        self.count[start:end] = total
+
+    def variance(self):
+        return self.M2 / np.maximum(self.count - 1, 1)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+# Merging t-digest per bucket. Each bucket holds at most compression / 2 + 1
+# weighted centroids; a chunk is merged by sorting its values together with
+# the centroids and regrouping them along the arcsine scale function, which
+# keeps centroids small near the tails, where the 5th and 95th percentiles
+# are read. All buckets are merged at once with NumPy.
+#
+# The centroids of a bucket are already in order, so only the chunk is
+# sorted (np.sort, much cheaper than argsort) and the stable argsort of the
+# two sorted runs that follows is a single merge pass of timsort.
+class QuantileDigest:
+    def __init__(self, numBuckets, compression=100):
+        self.compression = compression
+        self.numGroups = compression // 2 + 1
+        self.means = np.zeros((numBuckets, self.numGroups))
+        self.weights = np.zeros((numBuckets, self.numGroups))
+
+    def update(self, start, values):
+        values = np.asarray(values, dtype=float)
+        end = start + len(values)
+        if values.shape[1] == 0:
+            return
+        means = np.concatenate([self.means[start:end], np.sort(values, axis=1)], axis=1)
+        weights = np.concatenate([self.weights[start:end], np.ones(values.shape)], axis=1)
+        order = np.argsort(means, axis=1, kind='stable')
+        means = np.take_along_axis(means, order, axis=1)
+        weights = np.take_along_axis(weights, order, axis=1)
+
+        total = weights.sum(axis=1, keepdims=True)
+        q = (np.cumsum(weights, axis=1) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1) + self.compression / 4
+        groups = np.clip(np.floor(k).astype(int), 0, self.numGroups - 1)
+
+        rows = len(values)
+        flat = (groups + np.arange(rows)[:, None] * self.numGroups).ravel()
+        newWeights = np.bincount(flat, weights=weights.ravel(), minlength=rows * self.numGroups).reshape(rows, self.numGroups)
+        sums = np.bincount(flat, weights=(weights * means).ravel(), minlength=rows * self.numGroups).reshape(rows, self.numGroups)
+        self.weights[start:end] = newWeights
+        self.means[start:end] = np.divide(sums, newWeights, out=np.zeros_like(sums), where=newWeights > 0)
+
+    # Estimates of the given percentiles (0 to 100) per bucket, as a
+    # (len(percentiles) x buckets) array. Interpolates between centroids
+    # placed at the middle of their weight.
+    def percentiles(self, percentiles):
+        percentiles = np.asarray(percentiles, dtype=float)
+        result = np.full((len(percentiles), len(self.means)), np.nan)
+        for i in range(len(self.means)):
+            used = self.weights[i] > 0
+            weights = self.weights[i][used]
+            if len(weights) == 0:
+                continue
+            centers = (np.cumsum(weights) - weights / 2) / weights.sum()
+            result[:, i] = np.interp(percentiles / 100, centers, self.means[i][used])
+        return result
@@ -0,0 +1,293 @@
+import hashlib
+import math
+
+class ScheduleException(Exception):
+    pass
+
+class Schedule:
+    def __init__(self, string):
+        string = ''.join(string.split())
+        if not string:
+            raise ScheduleException('Error: No schedule entered.')
+        bracketDepth = 0
+        for ch in string:
+            if ch == '[':
+                bracketDepth += 1
+            elif ch == ']':
+                bracketDepth -= 1
+            if bracketDepth < 0:
+                break
+        if bracketDepth != 0:
+            raise ScheduleException('Error: Mismatched brackets in schedule string.')
+        self.rootItem = ScheduleItem(string)
+        self.currentIndex = None
+        self.compiledTimeline = None
+        
+    def doseAt(self, t):
+        doseIndex = self.rootItem.itemAt(t)
+        if doseIndex is None:
+            self.currentIndex = None
+            return 0
+        dose, index = doseIndex
+        if index != self.currentIndex:
+            self.currentIndex = index
+            return dose
+        return 0
+            
+    def totalRunTime(self):
+        return self.rootItem.duration
+
+    def doseEvents(self):
+        return self.rootItem.doseEvents(0, self.rootItem.duration)
+
+    # Number of events doseEvents visits, estimated from the parsed tree
+    # alone (exact up to rounding of the loop counts), so that huge regimens
+    # can be refused before the timeline is built.
+    def maxDoseEvents(self):
+        return self.rootItem.maxDoseEvents()
+
+    def timeline(self):
+        if self.compiledTimeline is None:
+            self.compiledTimeline = DoseTimeline(self.doseEvents(), self.totalRunTime())
+        return self.compiledTimeline
+
+# A schedule flattened once into sorted dose times (hours) and amounts (mg),
+# with doses that fall at the same time merged. Integrators walk it with a
+# cursor instead of querying the ScheduleItem tree on every step.
+class DoseTimeline:
+    def __init__(self, events, duration):
+        merged = {}
+        for t, mg in events:
+            merged[t] = merged.get(t, 0) + mg
+        self.times = sorted(merged)
+        self.mg = [merged[t] for t in self.times]
+        self.duration = duration
+
+    def __len__(self):
+        return len(self.times)
+
+    # Digest of the flattened regimen. Schedules that give the same doses at
+    # the same times over the same duration share it however they were
+    # written, e.g. '[0.5, 1d] x 1mo' and '[0.5, 24h] x 30d'.
+    def canonicalKey(self):
+        return hashlib.sha256(repr((self.duration, self.times, self.mg)).encode()).hexdigest()
+
+class ScheduleItem:
+    daysOfWeek = dict(zip(['Su', 'M', 'Tu', 'W', 'Th', 'F', 'Sa'], range(7)))
+    
+    def printItem(self, tabs=''):
+        if self.items:
+            print(tabs + 'SI(')
+            for item in self.items:
+                item.printItem(tabs + '    ')
+            print(tabs + str(self.dose) + 'mg, ' + str(self.duration) + 'h),')
+        else:
+            print(tabs + 'SI(' + str(self.dose) + 'mg, ' + str(self.duration) + 'h),')
+            
+
+    def __init__(self, string1, string2=None, itemType=None):
+        self.items = []
+        self.dose = 0
+        self.duration = -1
+        self.totalDuration = 0
+        
+        if itemType == 0 or itemType == None:
+            commaStrings = self.commaSplit(string1)
+            i = 0
+            while i < len(commaStrings):
+                cs = commaStrings[i]
+                if cs[0] == '[':
+                    endBracketI = cs.rfind(']')
+                    if endBracketI + 1 < len(cs):
+                        if cs[endBracketI + 1] == 'x':
+                            if endBracketI + 2 < len(cs):
+                                self.items.append(ScheduleItem(cs[1:endBracketI], cs[endBracketI + 2:], 0))
+                            else:
+                                raise ScheduleException('Error: No duration provided after \'x\'.')
+                        else:
+                            raise ScheduleException('Error: Invalid character \'' + cs[endBracketI + 1] + '\' after closing bracket \']\'.')
+                    else:
+                        self.items.append(ScheduleItem(cs[1:endBracketI], None, 0))
+                elif i + 1 < len(commaStrings):
+                    cs2 = commaStrings[i + 1]
+                    if all(ch.isalpha() for ch in cs2):
+                        self.items.append(ScheduleItem(cs, cs2, 2))
+                    elif all(ch.isalnum() or ch == '.' for ch in cs2):
+                        self.items.append(ScheduleItem(cs, cs2, 1))
+                    else:
+                        raise ScheduleException('Error: \'' + cs2 + '\' is not a valid duration or weekly schedule.')
+                    i += 1
+                else:
+                    self.items.append(ScheduleItem(cs, '1d', 1))
+                
+                i += 1
+            
+            if string2 is not None:
+                self.duration = self.parseTimeStringToHours(string2)
+        elif itemType == 1:
+            try:
+                self.dose = float(string1)
+            except Exception:
+                raise ScheduleException('Error: \'' + string1 + '\' is not a valid dose.')
+            if self.dose < 0:
+                raise ScheduleException('Error: Dose \'' + string1 + '\' is negative.')
+            self.duration = self.parseTimeStringToHours(string2)
+        elif itemType == 2:
+            weekday = ''
+            weekdays = []
+            for ch in string2:
+                if ch.isupper():
+                    if weekday:
+                        weekdays.append(weekday)
+                    weekday = ''
+                weekday += ch
+            if weekday:
+                weekdays.append(weekday)
+            weekdaysBool = [False] * 7
+            for wd in weekdays:
+                if wd not in self.daysOfWeek:
+                    raise ScheduleException('Error: \'' + wd + '\' is not a valid day of the week.')
+                weekdaysBool[self.daysOfWeek[wd]] = True
+            wait = 0
+            i = 0
+            dosing = False
+            while True:
+                if i == 7 or weekdaysBool[i]:
+                    if dosing:
+                        self.items.append(ScheduleItem(string1, str(wait) + 'd', 1))
+                    elif wait > 0:
+                        self.items.append(ScheduleItem('0', str(wait) + 'd', 1))
+                    dosing = True
+                    wait = 0
+                if i == 7:
+                    break
+                wait += 1
+                i += 1
+            
+        for item in self.items:
+            self.totalDuration += item.duration
+            
+        if self.duration == -1:
+            self.duration = self.totalDuration
+                
+        if self.duration == 0:
+            self.duration = 1
+                
+        if len(self.items) == 1 and self.duration <= self.items[0].duration:
+            self.totalDuration = self.items[0].totalDuration
+            self.dose = self.items[0].dose
+            self.items = self.items[0].items
+        
+        itemI = 0
+        while itemI < len(self.items):
+            item = self.items[itemI]
+            if len(item.items) > 0 and item.duration == item.totalDuration:
+                itemsToInsert = item.items
+                self.items = self.items[:itemI] + itemsToInsert + self.items[itemI + 1:]
+                itemI += len(itemsToInsert) - 1
+            itemI += 1
+        
+    def commaSplit(self, string):
+        splitList = []
+        
+        bracketDepth = 0
+        i1 = 0
+        i2 = 0
+        for ch in string:
+            if ch == '[':
+                bracketDepth += 1
+            elif ch == ']':
+                bracketDepth -= 1
+            elif ch == ',' and bracketDepth == 0:
+                if i2 - i1 > 0:
+                    splitList.append(string[i1:i2])
+                i1 = i2 + 1
+            i2 += 1
+            
+        if i2 == len(string) and i2 - i1 > 0:
+            splitList.append(string[i1:i2])
+                
+            
+        return splitList
+        
+    def parseTimeStringToHours(self, string):
+        endI = len(string)
+        for i in range(len(string)):
+            ch = string[i]
+            if not (ch.isdigit() or ch == '.'):
+                endI = i
+                break
+        number = 0
+        numStr = string[:endI]
+        try:
+            number = float(numStr)
+        except:
+            if numStr:
+                raise ScheduleException('Error: \'' + numStr + '\' is not a valid time duration.')
+            else:
+                raise ScheduleException('Error: \'' + string + '\' does not provide a time duration.')
+                
+        unit = string[endI:]
+        if unit == 'd' or unit == '':
+            return number * 24
+        elif unit == 'w':
+            return number * 7 * 24
+        elif unit == 'mo':
+            return number * 30 * 24
+        elif unit == 'y':
+            return number * 365 * 24
+        elif unit == 'h':
+            return number
+        else:
+            raise ScheduleException('Error: \'' + unit + '\' is not a valid time unit.')
+            
+    def itemAt(self, t):
+        if t < 0 or t >= self.duration:
+            return None
+            
+        if len(self.items) == 0:
+            return self.dose, []
+            
+        loops = math.floor(t / self.totalDuration)
+        t %= self.totalDuration
+        
+        i = 0
+        startT = 0
+        for item in self.items:
+            if t < startT + item.duration:
+                dose, indices = item.itemAt(t - startT)
+                return dose, [loops * len(self.items) + i] + indices
+            i += 1
+            startT += item.duration
+            
+        return None
+
+    def maxDoseEvents(self):
+        if len(self.items) == 0:
+            return 1
+        loops = self.duration / self.totalDuration
+        if math.isfinite(loops):
+            loops = math.ceil(loops)
+        return loops * sum(item.maxDoseEvents() for item in self.items)
+
+    def doseEvents(self, startT, endT):
+        endT = min(endT, startT + self.duration)
+        if startT >= endT:
+            return []
+
+        if len(self.items) == 0:
+            if self.dose == 0:
+                return []
+            return [(startT, self.dose)]
+
+        events = []
+        loopT = startT
+        while loopT < endT:
+            t = loopT
+            for item in self.items:
+                if t >= endT:
+                    break
+                events += item.doseEvents(t, endT)
+                t += item.duration
+            loopT += self.totalDuration
+        return events
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import io
+import json
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .jobs import runSimulation, summarize
+from .models import ModelException, getModel, models
+from .schedule import Schedule, ScheduleException
+
+# Headless HTTP/JSON front end to simulate, built on asyncio streams.
+#
+#   GET  /health    -> {"status": "ok"}
+#   GET  /models    -> {"models": [...]}
+#   POST /simulate  with a JSON body:
+#       schedule  schedule string (required)
+#       model     model name (default 'dutasteride')
+#       dt, resTime, method  as for simulate (defaults 0.01, 1, 'taylor')
+#       output    'series' (sampled outputs) or 'summary' (final, min, max
+#                 and mean of every output series)
+#       format    'json' or 'npz' (series only; binary NumPy arrays)
+#
+# Simulations, and the encoding of their results, run on a process pool so
+# the event loop never blocks, and identical requests in flight at the same
+# time share one simulation. Schedules are parsed and flattened in the pool
+# too. Bodies over maxBodyBytes, regimens of more than maxDoseEvents doses
+# and runs longer than maxSteps steps or maxSamples samples are refused, and
+# a worker that dies (e.g. out of memory) gets a 503 response and a fresh
+# pool.
+
+class RequestException(Exception):
+    pass
+
+# JSON has no NaN or infinity (e.g. from a dt past the stability limit), so
+# they are sent as null.
+def jsonValues(values):
+    values = np.asarray(values)
+    if np.isfinite(values).all():
+        return values.tolist()
+    return np.where(np.isfinite(values), values, None).tolist()
+
+# Runs in the worker processes: the coalescing key and run time of a
+# schedule. The dose count is checked before the timeline is built.
+def prepareSchedule(scheduleString, maxDoseEvents):
+    try:
+        schedule = Schedule(scheduleString)
+    except RecursionError:
+        raise ScheduleException('Error: the schedule is nested too deeply.')
+    if schedule.maxDoseEvents() > maxDoseEvents:
+        raise RequestException('Error: the schedule has more than ' + str(maxDoseEvents) + ' doses.')
+    return schedule.timeline().canonicalKey(), schedule.totalRunTime()
+
+# Runs in the worker processes: simulates and encodes the response body.
+def renderSimulation(scheduleString, model, dt, resTime, method, output, format):
+    result = runSimulation(scheduleString, model, dt, resTime, method)
+    if output == 'summary':
+        summary = { name : { key : value if math.isfinite(value) else None for key, value in statistics.items() } for name, statistics in summarize(result).items() }
+        content = { 'numSamples' : result['numSamples'], 'totalSimTime' : result['totalSimTime'], 'summary' : summary }
+        return 'application/json', json.dumps(content, allow_nan=False).encode()
+    if format == 'npz':
+        buffer = io.BytesIO()
+        np.savez(buffer, **result['series'])
+        return 'application/octet-stream', buffer.getvalue()
+    content = {
+        'numSamples' : result['numSamples'],
+        'totalSimTime' : result['totalSimTime'],
+        'resTime' : resTime,
+        'series' : { name : jsonValues(values) for name, values in result['series'].items() },
+    }
+    return 'application/json', json.dumps(content, allow_nan=False).encode()
+
+# A number from the request body; booleans, strings and null are rejected.
+def requestNumber(request, name, default):
+    value = request.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise RequestException('Error: \'' + name + '\' must be a number.')
+    return float(value)
+
+def requestString(request, name, default):
+    value = request.get(name, default)
+    if not isinstance(value, str):
+        raise RequestException('Error: \'' + name + '\' must be a string.')
+    return value
+
+class SimulationService:
+    def __init__(self, workers=None, maxSteps=10 ** 8, maxSamples=2 * 10 ** 6, maxDoseEvents=10 ** 5, maxBodyBytes=2 ** 20):
+        self.workers = workers
+        self.maxSteps = maxSteps
+        self.maxSamples = maxSamples
+        self.maxDoseEvents = maxDoseEvents
+        self.maxBodyBytes = maxBodyBytes
+        self.executor = self.startExecutor()
+        self.inFlight = {}
+        self.numSimulations = 0
+        self.numCoalesced = 0
+
+    # Workers are started with spawn: forked workers would inherit the sockets
+    # of connections open at the time and keep them from closing.
+    def startExecutor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def parseRequest(self, body):
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            raise RequestException('Error: request body is not valid JSON.')
+        if not isinstance(request, dict) or not isinstance(request.get('schedule'), str):
+            raise RequestException('Error: request needs a \'schedule\' string.')
+        options = {
+            'schedule' : request['schedule'],
+            'model' : getModel(requestString(request, 'model', 'dutasteride')).name,
+            'dt' : requestNumber(request, 'dt', 0.01),
+            'resTime' : requestNumber(request, 'resTime', 1),
+            'method' : requestString(request, 'method', 'taylor'),
+            'output' : requestString(request, 'output', 'series'),
+            'format' : requestString(request, 'format', 'json'),
+        }
+        if options['dt'] <= 0 or options['resTime'] <= 0:
+            raise RequestException('Error: dt and resTime must be positive.')
+        if options['output'] not in ('series', 'summary'):
+            raise RequestException('Error: output must be \'series\' or \'summary\'.')
+        if options['format'] not in ('json', 'npz'):
+            raise RequestException('Error: format must be \'json\' or \'npz\'.')
+        return options
+
+    # Requests that describe the same regimen (see DoseTimeline.canonicalKey)
+    # with the same settings wait on the same future, which resolves to the
+    # content type and body of the response.
+    async def simulate(self, options):
+        regimenKey, totalRunTime = await self.run(prepareSchedule, options['schedule'], self.maxDoseEvents)
+        if totalRunTime / options['dt'] > self.maxSteps:
+            raise RequestException('Error: the run would take more than ' + str(self.maxSteps) + ' steps; use a larger dt.')
+        if totalRunTime / options['resTime'] > self.maxSamples:
+            raise RequestException('Error: the run would produce more than ' + str(self.maxSamples) + ' samples; use a larger resTime.')
+        key = (regimenKey, options['model'], options['dt'], options['resTime'], options['method'], options['output'], options['format'])
+        future = self.inFlight.get(key)
+        if future is not None:
+            self.numCoalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self.run(renderSimulation, options['schedule'], options['model'], options['dt'], options['resTime'], options['method'], options['output'], options['format']))
+        self.inFlight[key] = future
+        self.numSimulations += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.inFlight.get(key) is future:
+                del self.inFlight[key]
+
+    # Runs function on the pool. Only the first request to notice a broken
+    # pool replaces it.
+    async def run(self, function, *args):
+        executor = self.executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+        except BrokenProcessPool:
+            if self.executor is executor:
+                executor.shutdown(wait=False)
+                self.executor = self.startExecutor()
+            raise
+
+    async def respond(self, method, path, body):
+        if path == '/health' and method == 'GET':
+            return 200, 'application/json', json.dumps({ 'status' : 'ok' }).encode()
+        if path == '/models' and method == 'GET':
+            return 200, 'application/json', json.dumps({ 'models' : list(models) }).encode()
+        if path != '/simulate':
+            return 404, 'application/json', json.dumps({ 'error' : 'Error: not found.' }).encode()
+        if method != 'POST':
+            return 405, 'application/json', json.dumps({ 'error' : 'Error: use POST.' }).encode()
+
+        try:
+            options = self.parseRequest(body)
+            contentType, content = await self.simulate(options)
+        except (RequestException, ScheduleException, ModelException, ValueError, TypeError) as e:
+            return 400, 'application/json', json.dumps({ 'error' : str(e) }).encode()
+        except BrokenProcessPool:
+            return 503, 'application/json', json.dumps({ 'error' : 'Error: the simulation worker failed; try again with a smaller run.' }).encode()
+        return 200, contentType, content
+
+    async def handle(self, reader, writer):
+        try:
+            requestLine = await reader.readline()
+            parts = requestLine.decode('latin-1').split()
+            if len(parts) < 2:
+                return
+            method, path = parts[0].upper(), parts[1].split('?')[0]
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value.strip())
+            if length > self.maxBodyBytes:
+                status, contentType, content = 413, 'application/json', json.dumps({ 'error' : 'Error: the request body is larger than ' + str(self.maxBodyBytes) + ' bytes.' }).encode()
+            else:
+                body = await reader.readexactly(length) if length else b''
+                status, contentType, content = await self.respond(method, path, body)
+            reason = { 200 : 'OK', 400 : 'Bad Request', 404 : 'Not Found', 405 : 'Method Not Allowed', 413 : 'Payload Too Large', 503 : 'Service Unavailable' }[status]
+            header = 'HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' % (status, reason, contentType, len(content))
+            writer.write(header.encode('latin-1') + content)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(host='127.0.0.1', port=8080, workers=None):
+    service = SimulationService(workers)
+    server = await asyncio.start_server(service.handle, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve pkpd simulations over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.workers))
@@ -0,0 +1,68 @@
+import pickle
+
+import numpy as np
+
+from .schedule import DoseTimeline
+from .simulation import Constants, SimulationData, TaylorState, runTaylor
+
+# A fixed-step simulation that can be extended with more dosing as it comes
+# in. The session keeps the loop state at the end of the run, the dose
+# timeline so far and the output; data is a SimulationData over the whole
+# history. Extending integrates only the new interval, and the result is
+# bit-identical to simulating the concatenated schedule from the start.
+class Session:
+    def __init__(self, dt, resTime, model='dutasteride', dtype=np.float64):
+        self.const = Constants(dt, model)
+        self.resTime = resTime
+        self.dtype = dtype
+        self.state = TaylorState(self.const, resTime)
+        self.timeline = DoseTimeline([], 0)
+        self.totalRunTime = 0
+        self.schedules = []
+        # Output buffers grow geometrically; data holds views of the filled part.
+        self.buffers = SimulationData(self.const.model, 0, dtype)
+        self.data = SimulationData(self.const.model, 0, dtype)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+def loadSession(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def startSession(dt, resTime, schedule, model='dutasteride', dtype=np.float64, jit=True):
+    return extend(Session(dt, resTime, model, dtype), schedule, jit)
+
+# Appends schedule after the end of the session's current run and integrates
+# only the appended interval. Returns the session.
+def extend(session, schedule, jit=True):
+    const = session.const
+    offset = session.totalRunTime
+    events = list(zip(session.timeline.times, session.timeline.mg))
+    events += [(offset + t, mg) for t, mg in zip(schedule.timeline().times, schedule.timeline().mg)]
+    totalRunTime = offset + schedule.totalRunTime()
+    timeline = DoseTimeline(events, totalRunTime)
+
+    numSteps = int(totalRunTime / const.dt)
+    capacity = int(numSteps * const.dt / session.resTime) + 2
+    names = const.model.seriesNames()
+    if capacity > session.buffers.numSamples:
+        buffers = SimulationData(const.model, max(capacity, 2 * session.buffers.numSamples), session.dtype)
+        for name in names:
+            buffers.series[name][:session.state.sample] = session.buffers.series[name][:session.state.sample]
+        session.buffers = buffers
+
+    runTaylor(const, session.state, timeline, numSteps, totalRunTime, session.resTime, [session.buffers.series[name] for name in names], None, jit)
+
+    data = SimulationData(const.model, 0, session.dtype)
+    for name in names:
+        data.setSeries(name, session.buffers.series[name][:session.state.sample])
+    data.numSamples = session.state.sample
+    data.totalSimTime = totalRunTime
+
+    session.timeline = timeline
+    session.totalRunTime = totalRunTime
+    session.schedules.append(schedule)
+    session.data = data
+    return session
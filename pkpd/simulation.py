@@ -0,0 +1,465 @@
+import copy
+import hashlib
+import math
+from time import perf_counter
+
+import numpy as np
+
+from .models import getModel
+
+class Constants:
+    def __init__(self, dt, model='dutasteride'):
+        self.model = getModel(model)
+
+        # Terms that are inactive for a model still get a harmless value so
+        # that closed-form helpers can read every constant.
+        self.V_max = 0
+        self.K_m = 1
+        self.ko_1 = 0
+        for name, value in self.model.params.items():
+            setattr(self, name, value)
+
+        self.k_23 = self.Q / self.V_c
+        self.k_32 = self.Q / self.V_p
+        self.k_20 = self.CL_l / self.V_c
+
+        self.saturableElimination = self.model.saturableElimination
+        self.srd5a1Inhibition = self.model.srd5a1Inhibition
+        self.scalpDHT = self.model.scalpDHT
+
+        self.dt = dt
+        self.dt2 = 0.5 * dt ** 2
+
+    # Digest of every constant (parameter arrays included), used to key
+    # cached results.
+    def fingerprint(self):
+        digest = hashlib.sha256()
+        for name in sorted(vars(self)):
+            value = self.model.name if name == 'model' else getattr(self, name)
+            digest.update(repr((name, np.asarray(value).tolist())).encode())
+        return digest.hexdigest()
+
+class Compartments:
+    def __init__(self, const):
+        self.A_1 = 0
+        self.A_2 = 0
+        self.A_3 = 0
+        self.A_4 = 0
+
+        self.DHT = const.DHT_ss
+        self.DHTp = 0
+        self.scalpDHTp = 0
+
+        self.S5AR1 = 1
+        self.S5AR2 = 1
+
+    def administer(self, mg):
+        self.A_1 += mg * 1000
+
+
+# Output series are preallocated contiguous arrays that integrators fill in
+# place; the front end and other consumers use them without copying. With a
+# storage sink (see pkpd.storage) the arrays are memory-mapped files instead.
+#
+# reducers adds per-bucket statistics ('min', 'max', 'mean') of every
+# integration step between consecutive samples, stored next to the point
+# samples as e.g. ySerumDutMin and ySerumDutMax.
+class SimulationData:
+    def __init__(self, model='dutasteride', numSamples=0, dtype=np.float64, storage=None, reducers=()):
+        self.model = getModel(model)
+        self.storage = storage
+        self.reducers = tuple(reducers)
+        self.series = {}
+        names = self.model.seriesNames()
+        names += [name + reducer.capitalize() for name in names for reducer in self.reducers]
+        for name in names:
+            if storage is None:
+                self.setSeries(name, np.zeros(numSamples, dtype=dtype))
+            else:
+                self.setSeries(name, storage.allocate(name, (numSamples,), dtype))
+        self.numSamples = numSamples
+        self.totalSimTime = 0
+        self.stats = None
+
+    def setSeries(self, name, values):
+        self.series[name] = values
+        setattr(self, name, values)
+
+    def truncate(self, numSamples):
+        for name in list(self.series):
+            self.setSeries(name, self.series[name][:numSamples])
+        self.numSamples = numSamples
+
+    def finish(self):
+        if self.storage is not None:
+            self.storage.finish(self)
+
+class BucketReducer:
+    def __init__(self, data, numOutputs):
+        self.targets = []
+        for name in data.model.seriesNames()[:numOutputs]:
+            self.targets.append([data.series[name + reducer.capitalize()] if reducer in data.reducers else None for reducer in ['min', 'max', 'mean']])
+        self.count = 0
+
+    def add(self, values):
+        if self.count == 0:
+            self.minimum = list(values)
+            self.maximum = list(values)
+            self.total = list(values)
+        else:
+            for k in range(len(values)):
+                value = values[k]
+                if value < self.minimum[k]:
+                    self.minimum[k] = value
+                elif value > self.maximum[k]:
+                    self.maximum[k] = value
+                self.total[k] += value
+        self.count += 1
+
+    # The open bucket in the layout of the compiled kernel (see pkpd.jit).
+    def toArray(self):
+        bucket = np.zeros(10)
+        bucket[0] = self.count
+        if self.count > 0:
+            for k in range(len(self.minimum)):
+                bucket[1 + k] = self.minimum[k]
+                bucket[4 + k] = self.maximum[k]
+                bucket[7 + k] = self.total[k]
+        return bucket
+
+    # Takes back the open bucket from the kernel and copies the buckets it
+    # finished, samples start to end, into the series.
+    def fromArray(self, bucket, reduced, start, end):
+        numOutputs = len(self.targets)
+        self.count = int(bucket[0])
+        if self.count > 0:
+            self.minimum = bucket[1:1 + numOutputs].tolist()
+            self.maximum = bucket[4:4 + numOutputs].tolist()
+            self.total = bucket[7:7 + numOutputs].tolist()
+        for k in range(numOutputs):
+            for r in range(3):
+                if self.targets[k][r] is not None:
+                    self.targets[k][r][start:end] = reduced[3 * k + r, start:end]
+
+    # Finishes the bucket that started with sample index; an empty bucket
+    # (resTime shorter than dt) falls back to the point sample values.
+    def write(self, index, values):
+        if self.count == 0:
+            self.add(values)
+        for k in range(len(self.targets)):
+            minimum, maximum, mean = self.targets[k]
+            if minimum is not None:
+                minimum[index] = self.minimum[k]
+            if maximum is not None:
+                maximum[index] = self.maximum[k]
+            if mean is not None:
+                mean[index] = self.total[k] / self.count
+        self.count = 0
+
+# Counters and phase timers of an instrumented fixed-step run (simulate with
+# instrument=True), returned as data.stats. substepSteps counts the steps on
+# which predictNextCompartmentValues fell back to N = 10 substeps. The
+# timers split the loop into the dose lookup, the step itself (right-hand
+# side and update) and writing samples; totalSeconds includes the timer
+# overhead.
+class SimulationStats:
+    def __init__(self):
+        self.steps = 0
+        self.substepSteps = 0
+        self.doseEvents = 0
+        self.samples = 0
+        self.scheduleSeconds = 0.0
+        self.rhsSeconds = 0.0
+        self.samplingSeconds = 0.0
+        self.totalSeconds = 0.0
+
+    def report(self):
+        lines = [
+            'steps:          %d' % self.steps,
+            'substep steps:  %d (%.2f%%)' % (self.substepSteps, 100 * self.substepSteps / max(1, self.steps)),
+            'dose events:    %d' % self.doseEvents,
+            'samples:        %d' % self.samples,
+        ]
+        for label, seconds in [('schedule', self.scheduleSeconds), ('rhs', self.rhsSeconds), ('sampling', self.samplingSeconds), ('total', self.totalSeconds)]:
+            lines.append('%-15s %.4f s (%.0f%%)' % (label + ':', seconds, 100 * seconds / (self.totalSeconds or 1)))
+        return '\n'.join(lines)
+
+# stats, if given, is a SimulationStats that counts substep fallbacks.
+def predictNextCompartmentValues(comp, const, useSecondOrder, stats=None):
+    N = 1
+    dt = const.dt
+    dt2 = const.dt2
+    saturable = const.saturableElimination
+    srd5a1 = const.srd5a1Inhibition
+
+    dS5AR2 = const.k_2 - const.k_2 * comp.S5AR2 - const.ko_2 * comp.A_4 * comp.S5AR2
+    stable = abs(dS5AR2) < comp.S5AR2 * 100
+    if srd5a1:
+        dS5AR1 = const.k_1 - const.k_1 * comp.S5AR1 - const.ko_1 * comp.A_4 * comp.S5AR1
+        stable = stable and abs(dS5AR1) < comp.S5AR1 * 100
+    if not stable:
+        N = 10
+        if stats is not None:
+            stats.substepSteps += 1
+        dt /= N
+        dt2 /= N * N
+
+    A_1 = comp.A_1
+    A_2 = comp.A_2
+    A_3 = comp.A_3
+    A_4 = comp.A_4
+    DHT = comp.DHT
+    S5AR1 = comp.S5AR1
+    S5AR2 = comp.S5AR2
+
+    k23k20 = const.k_23 + const.k_20
+    dS5AR1 = 0
+    d2S5AR1 = 0
+    for i in range(N):
+        dA_1 = -const.k_a * A_1
+        dA_2 = const.k_a * A_1 - k23k20 * A_2 + const.k_32 * A_3
+        if saturable:
+            vckma2 = const.V_c * const.K_m + A_2
+            dA_2 -= const.V_max * A_2 / vckma2
+        dA_3 = const.k_23 * A_2 - const.k_32 * A_3
+        dA_4 = dA_2 / const.V_c
+        dDHT = const.k_out * const.DHT_ss * const.FAR_2 * S5AR2 + const.k_out * const.DHT_ss * (1 - const.FAR_2) * S5AR1 - const.k_out * DHT
+        if srd5a1:
+            dS5AR1 = const.k_1 - const.k_1 * S5AR1 - const.ko_1 * A_4 * S5AR1
+        dS5AR2 = const.k_2 - const.k_2 * S5AR2 - const.ko_2 * A_4 * S5AR2
+
+        if useSecondOrder:
+            d2A_1 = -const.k_a * dA_1
+            d2A_2 = const.k_a * dA_1 - k23k20 * dA_2 + const.k_32 * dA_3
+            if saturable:
+                d2A_2 -= const.V_max * (vckma2 * dA_2 - A_2 * dA_2) / (vckma2 ** 2)
+            d2A_3 = const.k_23 * dA_2 - const.k_32 * dA_3
+            d2A_4 = d2A_2 / const.V_c
+            d2DHT = const.k_out * const.DHT_ss * const.FAR_2 * dS5AR2 + const.k_out * const.DHT_ss * (1 - const.FAR_2) * dS5AR1 - const.k_out * dDHT
+            if srd5a1:
+                d2S5AR1 = -const.k_1 * dS5AR1 - const.ko_1 * (A_4 * dS5AR1 + dA_4 * S5AR1)
+            d2S5AR2 = -const.k_2 * dS5AR2 - const.ko_2 * (A_4 * dS5AR2 + dA_4 * S5AR2)
+
+        A_1 += dA_1 * dt
+        A_2 += dA_2 * dt
+        A_3 += dA_3 * dt
+        A_4 += dA_4 * dt
+        DHT += dDHT * dt
+        S5AR1 += dS5AR1 * dt
+        S5AR2 += dS5AR2 * dt
+
+        if useSecondOrder:
+            A_1 += d2A_1 * dt2
+            A_2 += d2A_2 * dt2
+            A_3 += d2A_3 * dt2
+            A_4 += d2A_4 * dt2
+            DHT += d2DHT * dt2
+            S5AR1 += d2S5AR1 * dt2
+            S5AR2 += d2S5AR2 * dt2
+
+    comp.A_1 = A_1
+    comp.A_2 = A_2
+    comp.A_3 = A_3
+    comp.A_4 = A_4
+    comp.DHT = DHT
+    comp.S5AR1 = S5AR1
+    comp.S5AR2 = S5AR2
+
+    comp.DHTp = 100 * (1 - comp.DHT / const.DHT_ss)
+    if const.scalpDHT:
+        comp.scalpDHTp = 100 * (1 - scalpDHTReduction(comp.A_3))
+
+# Scalp DHT reduction fitted to the Olsen et al. dutasteride data; only
+# meaningful for models with scalpDHT enabled.
+def scalpDHTReduction(A_3):
+    c = A_3
+    return 0.358 * (1 - c / (68.235 + c)) + 0.642 * (1 - c / (27614.478 + c))
+
+def A_3_steadyState(const, dose):
+    d = dose * 1000 / 24
+    return const.k_23 / const.k_32 * (-(d - const.k_20 * const.K_m * const.V_c - const.V_max) - math.sqrt((d - const.k_20 * const.K_m * const.V_c - const.V_max) ** 2 + 4 * const.k_20 * const.K_m * const.V_c * d)) / (-2 * const.k_20)
+
+def scalpDHTReductionSteadyState(const, dose):
+    return scalpDHTReduction(A_3_steadyState(const, dose))
+
+# method selects the integrator: 'taylor' is the fixed-step second-order
+# scheme below, 'adaptive' the error-controlled Dormand-Prince integrator (dt is
+# its first step) and 'exponential' the exact solver for linear PK models.
+# Extra keyword options are passed on to the selected integrator.
+#
+# resTime may be coarser than dt: the integrator still steps at dt but only
+# emits one sample per resTime, optionally with per-bucket reducers (see
+# SimulationData) so that peaks between samples are kept.
+#
+# With jit (the default) the fixed-step loop, reducers included, runs as one
+# Numba-compiled kernel (see pkpd.jit) when Numba is installed.
+#
+# instrument runs the fixed-step loop with counters and timers and returns
+# them as data.stats (a SimulationStats). It always uses the Python loop and
+# is slower; without it the loop carries no instrumentation at all.
+def simulate(dt, resTime, schedule, model='dutasteride', method='taylor', dtype=np.float64, storage=None, reducers=(), jit=True, instrument=False, **options):
+    if instrument and method != 'taylor':
+        raise ValueError('Instrumentation is only available for the taylor method.')
+    if method == 'adaptive':
+        from .adaptive import simulateAdaptive
+        return simulateAdaptive(resTime, schedule, model, firstStep=dt, dtype=dtype, storage=storage, **options)
+    if method == 'exponential':
+        from .linear import simulateLinear
+        return simulateLinear(resTime, schedule, model, dtype=dtype, storage=storage, **options)
+    if method != 'taylor':
+        raise ValueError('Unknown integration method \'' + str(method) + '\'.')
+
+    const = Constants(dt, model)
+    timeline = schedule.timeline()
+    numSteps = int(schedule.totalRunTime() / dt)
+    # Float drift in sampleTime can only delay a sample, so this bound holds.
+    data = SimulationData(const.model, int(numSteps * dt / resTime) + 2, dtype, storage, reducers)
+    series = [data.series[name] for name in const.model.seriesNames()]
+
+    state = TaylorState(const, resTime)
+    bucket = BucketReducer(data, len(series)) if reducers else None
+    stats = SimulationStats() if instrument else None
+    runTaylor(const, state, timeline, numSteps, schedule.totalRunTime(), resTime, series, bucket, jit, stats)
+
+    if bucket is not None and state.sample > 0:
+        bucket.write(state.sample - 1, [s[state.sample - 1] for s in series])
+    data.truncate(state.sample)
+    data.totalSimTime = schedule.totalRunTime()
+    data.stats = stats
+    data.finish()
+
+    return data
+
+# Everything the fixed-step loop carries from one step to the next, so that a
+# run can stop after any step and later continue from a copy of its state
+# with bit-identical results.
+class TaylorState:
+    def __init__(self, const, resTime):
+        self.comp = Compartments(const)
+        self.step = 0
+        self.time = 0
+        self.sampleTime = resTime
+        self.sample = 0
+        self.nextDose = 0
+
+    def copy(self):
+        state = copy.copy(self)
+        state.comp = copy.copy(self.comp)
+        return state
+
+# Advances the fixed-step loop from state until step stopStep (or until time
+# passes totalRunTime), writing samples into series and updating state in
+# place. Uses the compiled kernel when jit is set, Numba is installed and no
+# stats are attached.
+def runTaylor(const, state, timeline, stopStep, totalRunTime, resTime, series, bucket=None, jit=True, stats=None):
+    if stats is not None:
+        return runTaylorInstrumented(const, state, timeline, stopStep, totalRunTime, resTime, series, bucket, stats)
+    comp = state.comp
+    if jit:
+        from .jit import compiledSimulate
+        if compiledSimulate is not None:
+            out = [np.asarray(s) for s in series] + [np.asarray(series[-1])] * (3 - len(series))
+            values = np.array([comp.A_1, comp.A_2, comp.A_3, comp.A_4, comp.DHT, comp.S5AR1, comp.S5AR2, comp.DHTp, comp.scalpDHTp, state.time, state.sampleTime], dtype=float)
+            counters = np.array([state.step, state.sample, state.nextDose], dtype=np.int64)
+            firstSample = state.sample
+            reduced = np.empty((9, len(out[0]) if bucket is not None else 0))
+            bucketState = bucket.toArray() if bucket is not None else np.zeros(10)
+            compiledSimulate(const.k_a, const.k_23, const.k_32, const.k_20, const.V_c, const.V_max, const.K_m, const.k_out, const.DHT_ss, const.FAR_2, const.k_1, const.ko_1, const.k_2, const.ko_2,
+                             const.saturableElimination, const.srd5a1Inhibition, const.scalpDHT, const.dt, const.dt2, resTime, stopStep, totalRunTime,
+                             np.array(timeline.times, dtype=float), np.array(timeline.mg, dtype=float), *out, values, counters, bucket is not None, reduced, bucketState)
+            comp.A_1, comp.A_2, comp.A_3, comp.A_4, comp.DHT, comp.S5AR1, comp.S5AR2, comp.DHTp, comp.scalpDHTp, state.time, state.sampleTime = values.tolist()
+            state.step, state.sample, state.nextDose = counters.tolist()
+            if bucket is not None:
+                bucket.fromArray(bucketState, reduced, max(firstSample - 1, 0), max(state.sample - 1, 0))
+            return
+
+    doseTimes = timeline.times
+    doseMg = timeline.mg
+    numDoses = len(timeline)
+    nextDose = state.nextDose
+    time = state.time
+    sampleTime = state.sampleTime
+    sample = state.sample
+    i = state.step
+    while i < stopStep:
+        while nextDose < numDoses and doseTimes[nextDose] <= time:
+            comp.administer(doseMg[nextDose])
+            nextDose += 1
+        if time > totalRunTime:
+            break
+
+        while sampleTime >= resTime:
+            sampleTime -= resTime
+            if bucket is not None and sample > 0:
+                bucket.write(sample - 1, [s[sample - 1] for s in series])
+            series[0][sample] = comp.A_4
+            series[1][sample] = comp.DHTp
+            if const.scalpDHT:
+                series[2][sample] = comp.scalpDHTp
+            sample += 1
+        if bucket is not None:
+            bucket.add((comp.A_4, comp.DHTp, comp.scalpDHTp)[:len(series)])
+
+        predictNextCompartmentValues(comp, const, True)
+        time += const.dt
+        sampleTime += const.dt
+        i += 1
+
+    state.step = i
+    state.time = time
+    state.sampleTime = sampleTime
+    state.sample = sample
+    state.nextDose = nextDose
+
+# runTaylor's Python loop with the counters and phase timers of stats added.
+# The float operations are the same, so the results are too.
+def runTaylorInstrumented(const, state, timeline, stopStep, totalRunTime, resTime, series, bucket, stats):
+    comp = state.comp
+    doseTimes = timeline.times
+    doseMg = timeline.mg
+    numDoses = len(timeline)
+    nextDose = state.nextDose
+    time = state.time
+    sampleTime = state.sampleTime
+    sample = state.sample
+    i = state.step
+    start = perf_counter()
+    while i < stopStep:
+        t0 = perf_counter()
+        while nextDose < numDoses and doseTimes[nextDose] <= time:
+            comp.administer(doseMg[nextDose])
+            nextDose += 1
+            stats.doseEvents += 1
+        t1 = perf_counter()
+        stats.scheduleSeconds += t1 - t0
+        if time > totalRunTime:
+            break
+
+        while sampleTime >= resTime:
+            sampleTime -= resTime
+            if bucket is not None and sample > 0:
+                bucket.write(sample - 1, [s[sample - 1] for s in series])
+            series[0][sample] = comp.A_4
+            series[1][sample] = comp.DHTp
+            if const.scalpDHT:
+                series[2][sample] = comp.scalpDHTp
+            sample += 1
+            stats.samples += 1
+        if bucket is not None:
+            bucket.add((comp.A_4, comp.DHTp, comp.scalpDHTp)[:len(series)])
+        t2 = perf_counter()
+        stats.samplingSeconds += t2 - t1
+
+        predictNextCompartmentValues(comp, const, True, stats)
+        stats.rhsSeconds += perf_counter() - t2
+        stats.steps += 1
+        time += const.dt
+        sampleTime += const.dt
+        i += 1
+    stats.totalSeconds += perf_counter() - start
+
+    state.step = i
+    state.time = time
+    state.sampleTime = sampleTime
+    state.sample = sample
+    state.nextDose = nextDose
@@ -0,0 +1,111 @@
+import numpy as np
+
+from .adaptive import AdaptiveIntegrator, integrateSamples
+from .batch import BatchSystem, doseSteps, initialBatchState, predictNextBatchValues
+from .models import ModelException
+from .simulation import Constants, scalpDHTReduction
+
+# Plateau of a regimen repeated forever. trough, peak and average map each
+# output series of the model (see DrugModel.seriesNames) to its minimum,
+# maximum and mean over one period at steady state; state is the 7 state
+# variables at the start of the period, just before its first dose.
+class SteadyState:
+    def __init__(self, model, period, state, series, iterations):
+        self.model = model
+        self.period = period
+        self.state = state
+        self.series = series
+        self.iterations = iterations
+        self.trough = { name : float(values.min()) for name, values in series.items() }
+        self.peak = { name : float(values.max()) for name, values in series.items() }
+        self.average = { name : float(values.mean()) for name, values in series.items() }
+
+# Steps every column of y through one period with the fixed-step integrator,
+# applying the period's doses on the steps they land on. record, if given, is
+# called with the state before each step.
+def integratePeriod(system, y, numSteps, doses, record=None):
+    y = y.copy()
+    for i in range(numSteps):
+        if i in doses:
+            y[0] += doses[i]
+        if record is not None:
+            record(i, y)
+        y = predictNextBatchValues(y, system, True)
+    return y
+
+# Finds the periodic steady state of schedule repeated indefinitely: the state
+# y with F(y) = y, where F integrates one period of the schedule from y. Newton
+# iteration on F(y) - y with a finite-difference Jacobian converges in a few
+# periods even for the long dutasteride half-life, where simply simulating
+# would take months of loading. The base state and one perturbed copy per
+# state variable are integrated together as one batch.
+#
+# method 'taylor' integrates the period with the fixed-step batch integrator,
+# matching simulate; 'adaptive' uses the Dormand-Prince integrator, which is
+# much faster for long periods. initialState (e.g. the state of a similar
+# regimen) can shorten the iteration.
+def periodicSteadyState(schedule, model='dutasteride', dt=0.01, tol=1e-10, maxIterations=50, method='taylor', initialState=None, rtol=1e-8, atol=1e-8):
+    const = Constants(dt, model)
+    period = schedule.totalRunTime()
+    numSteps = int(period / dt)
+    if numSteps == 0:
+        raise ModelException('Error: the dosing period must be at least one step long.')
+    if method not in ('taylor', 'adaptive'):
+        raise ValueError('Unknown integration method \'' + str(method) + '\'.')
+
+    timeline = schedule.timeline()
+    doses = {}
+    for step, mg in zip(doseSteps(timeline.times, dt), timeline.mg):
+        if step < numSteps:
+            doses[int(step)] = doses.get(int(step), 0) + mg * 1000
+    system = BatchSystem(const)
+    if system.perRow:
+        raise ModelException('Error: periodicSteadyState needs scalar model parameters.')
+    sampleTimes = np.arange(numSteps) * dt
+
+    # One period from every column of y. record gets the state at the start
+    # of each step (taylor) or at the same times interpolated (adaptive), one
+    # row per time.
+    def propagate(y, record=None):
+        if method == 'taylor':
+            return integratePeriod(system, y, numSteps, doses, None if record is None else lambda i, yStep: record(i, yStep[None]))
+        integrator = AdaptiveIntegrator(const, rtol, atol, dt, period)
+        return integrateSamples(integrator, y.copy(), schedule, sampleTimes if record is not None else sampleTimes[:0], record or (lambda start, states: None))
+
+    # A_4 is A_2 / V_c along any trajectory, so Newton only solves for the
+    # other states and A_4 follows from A_2. S5AR1 stays at 1 without SRD5A1
+    # inhibition.
+    free = [0, 1, 2, 4, 5, 6] if const.srd5a1Inhibition else [0, 1, 2, 4, 6]
+    y = initialBatchState(const, 1)[0] if initialState is None else np.array(initialState, dtype=float)
+    y[3] = y[1] / const.V_c
+    iterations = 0
+    converged = False
+    while iterations < maxIterations and not converged:
+        iterations += 1
+        steps = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(y[free]), 1)
+        columns = np.repeat(y[:, None], len(free) + 1, axis=1)
+        columns[free, np.arange(1, len(free) + 1)] += steps
+        columns[3] = columns[1] / const.V_c
+        end = propagate(columns)
+
+        residual = end[free, 0] - y[free]
+        converged = np.all(np.abs(residual) <= tol * (1 + np.abs(y[free])))
+        J = (end[free, 1:] - end[free, :1]) / steps
+        y[free] += np.linalg.solve(J - np.eye(len(free)), -residual)
+        y[:3] = np.maximum(y[:3], 0)
+        y[3] = y[1] / const.V_c
+
+    if not converged:
+        raise ModelException('Error: periodic steady state did not converge in ' + str(maxIterations) + ' iterations.')
+
+    states = np.empty((numSteps, len(y)))
+    def record(start, yStates):
+        states[start:start + len(yStates)] = yStates[:, :, 0]
+    propagate(y[:, None], record)
+
+    names = const.model.seriesNames()
+    series = { names[0] : states[:, 3], names[1] : 100 * (1 - states[:, 4] / const.DHT_ss) }
+    if const.scalpDHT:
+        series[names[2]] = 100 * (1 - scalpDHTReduction(states[:, 2]))
+
+    return SteadyState(const.model, period, y, series, iterations)
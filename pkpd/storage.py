@@ -0,0 +1,71 @@
+import json
+import os
+
+import numpy as np
+
+from .batch import BatchSimulationData
+from .models import getModel
+from .simulation import SimulationData
+
+# Output sink that backs every series with a memory-mapped .npy file in a
+# directory, so integrators stream samples to disk as they produce them and
+# runs larger than RAM never need to be held in memory. A meta.json file next
+# to the arrays records what openSimulation needs to read the result back.
+class MemmapStorage:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.npy')
+
+    def allocate(self, name, shape, dtype):
+        return np.lib.format.open_memmap(self.path(name), mode='w+', dtype=dtype, shape=shape)
+
+    def finish(self, data):
+        for values in data.series.values():
+            if isinstance(values, np.memmap):
+                values.flush()
+        meta = {
+            'model': data.model.name,
+            'series': list(data.series),
+            'numSamples': np.asarray(data.numSamples).tolist(),
+            'totalSimTime': np.asarray(data.totalSimTime).tolist(),
+        }
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+# Writes a finished in-memory result in the MemmapStorage layout so that
+# openSimulation can read it back.
+def saveSimulation(data, directory):
+    storage = MemmapStorage(directory)
+    for name, values in data.series.items():
+        values = np.asarray(values)
+        np.save(storage.path(name), values.T if isinstance(data, BatchSimulationData) else values)
+    storage.finish(data)
+
+# Opens a stored result without reading the samples: every series is a
+# read-only memory map. Batch results come back as BatchSimulationData.
+# Only the model's name is stored, so pass model when it is not the
+# registered one (e.g. a withParams variant or an unregistered DrugModel).
+def openSimulation(directory, model=None):
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    model = getModel(meta['model'] if model is None else model)
+    storage = MemmapStorage(directory)
+
+    if isinstance(meta['numSamples'], list):
+        data = BatchSimulationData(model, 0, 0)
+        for name in meta['series']:
+            data.series[name] = np.load(storage.path(name), mmap_mode='r').T
+            setattr(data, name, data.series[name])
+        data.numSamples = np.array(meta['numSamples'], dtype=int)
+        data.totalSimTime = np.array(meta['totalSimTime'])
+        return data
+
+    data = SimulationData(model)
+    for name in meta['series']:
+        data.setSeries(name, np.load(storage.path(name), mmap_mode='r')[:meta['numSamples']])
+    data.numSamples = meta['numSamples']
+    data.totalSimTime = meta['totalSimTime']
+    return data
@@ -0,0 +1,91 @@
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .models import getModel
+from .schedule import Schedule
+from .simulation import simulate
+
+# Numbers are written out in full, without an exponent (which the schedule
+# parser does not accept in times), and with every digit needed to read back
+# the same float, so the simulated regimen is exactly the one reported.
+def numberString(value):
+    return np.format_float_positional(float(value), trim='-')
+
+# Time values in sweep grids are schedule time strings ('12h', '3d', '1w') or
+# numbers of hours.
+def timeString(value):
+    if isinstance(value, str):
+        return value
+    return numberString(value) + 'h'
+
+def timeHours(value):
+    if isinstance(value, str):
+        return Schedule('[0, ' + value + ']').totalRunTime()
+    return float(value)
+
+def regimenString(dose, interval, duration):
+    return '[%s, %s] x %s' % (numberString(dose), timeString(interval), timeString(duration))
+
+# Summary of one simulated regimen. For every output series: the value at the
+# end of the run, the trough and peak over the last dosing interval, and the
+# overall peak.
+def summarize(data, intervalHours, resTime):
+    metrics = {}
+    last = max(1, min(data.numSamples, int(round(intervalHours / resTime))))
+    for name in data.model.seriesNames():
+        values = data.series[name]
+        if data.numSamples == 0:
+            metrics[name + 'Final'] = metrics[name + 'Trough'] = metrics[name + 'Peak'] = metrics[name + 'Max'] = math.nan
+            continue
+        tail = values[data.numSamples - last:data.numSamples]
+        metrics[name + 'Final'] = float(values[data.numSamples - 1])
+        metrics[name + 'Trough'] = float(tail.min())
+        metrics[name + 'Peak'] = float(tail.max())
+        metrics[name + 'Max'] = float(values[:data.numSamples].max())
+    return metrics
+
+# Runs in the worker processes: simulates one chunk of regimens.
+def sweepChunk(job):
+    regimens, model, dt, resTime, method = job
+    rows = []
+    for dose, interval, duration in regimens:
+        intervalHours = timeHours(interval)
+        data = simulate(dt, resTime, Schedule(regimenString(dose, interval, duration)), model, method)
+        row = {
+            'dose': float(dose),
+            'interval': intervalHours,
+            'duration': timeHours(duration),
+            'weeklyMg': dose * 168 / intervalHours,
+        }
+        row.update(summarize(data, intervalHours, resTime))
+        rows.append(row)
+    return rows
+
+# Simulates every combination of the dose (mg), interval and duration grids
+# as '[dose, interval] x duration' and returns a column table: a dict mapping
+# each column name to an array with one entry per regimen, in grid order.
+# Regimens are split into chunks and simulated on a process pool; workers=1
+# runs everything in this process.
+def sweep(doses, intervals, durations, model='dutasteride', dt=0.01, resTime=1, method='taylor', workers=None, chunkSize=None):
+    model = getModel(model)
+    regimens = list(itertools.product(doses, intervals, durations))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunkSize is None:
+        # A few chunks per worker keeps the pool busy when regimen lengths differ.
+        chunkSize = max(1, int(math.ceil(len(regimens) / (workers * 4))))
+    jobs = [(regimens[i:i + chunkSize], model, dt, resTime, method) for i in range(0, len(regimens), chunkSize)]
+
+    if workers <= 1:
+        chunks = [sweepChunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(sweepChunk, jobs))
+
+    rows = [row for chunk in chunks for row in chunk]
+    columns = list(rows[0]) if rows else ['dose', 'interval', 'duration', 'weeklyMg']
+    return { name : np.array([row[name] for row in rows]) for name in columns }